@@ -0,0 +1,143 @@
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+from data import final_week, first_week
+from ratings import CONVERGENCE_DIGITS, VARIANTS, VARIANT_DEPENDENCIES, solve_variant
+
+type Node = tuple[int, int, str]  # (year, week, variant)
+
+
+def _tag(node: Node) -> str:
+    year, week, variant = node
+    return f"{year}w{week:02}{variant}"
+
+
+def parse_range(text: str) -> range | None:
+    if text == "all":
+        return None
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+def available_years() -> list[int]:
+    return sorted(
+        int(match[1])
+        for file in os.listdir()
+        if (match := re.fullmatch(r"(\d{4})\.csv", file))
+    )
+
+
+def solve_graph(
+    years: list[int], weeks: range | None, incremental: bool = True
+) -> dict[Node, list[Node]]:
+    # Each solve maps to the solves it needs first: the squashed runs seed the
+    # full FBS run, and a warm start needs the previous week of its variant
+    graph: dict[Node, list[Node]] = {}
+    for year in years:
+        # Weeks before the first game would select nothing to solve
+        start_week = first_week(f"{year}.csv")
+        last_week = final_week(f"{year}.csv")
+        for week in weeks or range(start_week, last_week + 1):
+            if week > last_week:
+                break
+            if week < start_week:
+                continue
+            for variant in VARIANTS:
+                dependencies = [
+                    (year, week, dependency)
+                    for dependency in VARIANT_DEPENDENCIES[variant]
+                ]
+                if incremental and (year, week - 1, variant) in graph:
+                    dependencies.append((year, week - 1, variant))
+                graph[(year, week, variant)] = dependencies
+    return graph
+
+
+def _solve(node: Node, convergence: float, incremental: bool) -> float:
+    start = time.perf_counter()
+    solve_variant(*node, convergence=convergence, incremental=incremental)
+    return time.perf_counter() - start
+
+
+def backfill(
+    graph: dict[Node, list[Node]],
+    convergence: float = 10.0**-CONVERGENCE_DIGITS,
+    incremental: bool = True,
+    jobs: int | None = None,
+) -> list[Node]:
+    # Finished solves live in the ratings cache under their content key, so
+    # rerunning after a crash turns every completed node into a cache hit
+    waiting = {node: set(dependencies) for node, dependencies in graph.items()}
+    dependents: dict[Node, list[Node]] = {node: [] for node in graph}
+    for node, dependencies in graph.items():
+        for dependency in dependencies:
+            dependents[dependency].append(node)
+    running: dict[Future, Node] = {}
+    failed: list[Node] = []
+    done = 0
+
+    def skip(node: Node) -> None:
+        nonlocal done
+        for dependent in dependents[node]:
+            if waiting.pop(dependent, None) is not None:
+                done += 1
+                failed.append(dependent)
+                print(f"[{done}/{len(graph)}] {_tag(dependent)} skipped", flush=True)
+                skip(dependent)
+
+    with ProcessPoolExecutor(jobs) as pool:
+        while waiting or running:
+            for node in sorted(node for node in waiting if not waiting[node]):
+                del waiting[node]
+                running[pool.submit(_solve, node, convergence, incremental)] = node
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                done += 1
+                try:
+                    elapsed = future.result()
+                except Exception as error:
+                    failed.append(node)
+                    print(
+                        f"[{done}/{len(graph)}] {_tag(node)} failed: {error!r}",
+                        flush=True,
+                    )
+                    skip(node)
+                    continue
+                print(f"[{done}/{len(graph)}] {_tag(node)} {elapsed:.1f}s", flush=True)
+                for dependent in dependents[node]:
+                    if dependent in waiting:
+                        waiting[dependent].discard(node)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Solve and cache every week of a range of seasons"
+    )
+    parser.add_argument("years", help="a year, a range like 2020-2024, or all")
+    parser.add_argument("weeks", nargs="?", default="all", help="default: all")
+    parser.add_argument("--jobs", type=int, help="worker processes")
+    parser.add_argument("--convergence", type=float, default=10.0**-CONVERGENCE_DIGITS)
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="solve each week from scratch instead of from the week before",
+    )
+    args = parser.parse_args()
+    years = parse_range(args.years)
+    failed = backfill(
+        solve_graph(
+            available_years() if years is None else list(years),
+            parse_range(args.weeks),
+            not args.cold,
+        ),
+        args.convergence,
+        not args.cold,
+        args.jobs,
+    )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,334 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import scipy.integrate as integrate
+import scipy.special as special
+
+import brr_math
+import data
+import memo
+from brr_math import SOLVER_VERSION
+from cache import CACHE_FILE, RatingsStore, content_key, file_digest
+from data import add_division_filter, add_week_filter, columnar, csv2list
+from ratings import fbs_with_fcs, solve_league
+
+BASELINE_FILE = "BenchmarkBaseline.json"
+REPO = os.path.dirname(os.path.abspath(__file__))
+SHIPPED = {"2024": 2024, "2025": 2025}
+# Synthetic seasons are written to the scratch directory as fake years
+SYNTHETIC = {"1k": 1_000, "5k": 5_000, "20k": 20_000, "50k": 50_000}
+CASES = ("load", "sweep", "parity", "fbs_with_fcs", "league", "startup")
+# A full pipeline run on a synthetic league takes hours with the quad engine,
+# and so does a quad sweep over the largest, so those only run when asked for
+DEFAULT_MATRIX = [
+    (case, season)
+    for case in CASES
+    for season in [*SHIPPED, *SYNTHETIC]
+    if (case not in ("fbs_with_fcs", "startup") or season in SHIPPED)
+    and (case, season) != ("sweep", "50k")
+]
+REPEATS = {
+    "load": 5,
+    "sweep": 1,
+    "parity": 5,
+    "fbs_with_fcs": 1,
+    "league": 1,
+    "startup": 5,
+}
+# A fresh interpreter answering from the ratings cache, as the entry points do;
+# none of SciPy may be loaded along the way
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import conference, ratings
+ratings.get_fbs_ratings({year}, {week})
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, sorted(sys.modules)]))
+"""
+STARTUP_FORBIDDEN = ("scipy.integrate.", "scipy.optimize.", "scipy.special.")
+TOLERANCE = 0.2
+
+
+def season_year(season: str) -> int:
+    if season in SHIPPED:
+        return SHIPPED[season]
+    return 9000 + SYNTHETIC[season] // 1000
+
+
+def write_synthetic_season(teams: int, path: str, seed: int = 0) -> None:
+    # Half FBS and half FCS in conferences of 12, twelve weeks of games with
+    # outcomes drawn from hidden ratings
+    rng = np.random.default_rng(seed)
+    strength = rng.normal(size=teams)
+    division = np.where(np.arange(teams) < teams // 2, "fbs", "fcs")
+    kickoff = datetime(2024, 8, 31, 16, tzinfo=timezone.utc)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
+        writer.writerow(
+            [
+                "Week",
+                "Season Type",
+                "Start Date",
+                "Completed",
+                "Home Id",
+                "Home Team",
+                "Home Division",
+                "Home Conference",
+                "Home Points",
+                "Away Id",
+                "Away Team",
+                "Away Division",
+                "Away Conference",
+                "Away Points",
+            ]
+        )
+        for week in range(1, 13):
+            fbs = rng.permutation(teams // 2)
+            fcs = teams // 2 + rng.permutation(teams - teams // 2)
+            # About as many FBS v. FCS games as a real season, all in week 1
+            cross = min(100, teams // 20) if week == 1 else 0
+            order = np.concatenate(
+                (
+                    np.column_stack((fbs[:cross], fcs[:cross])).ravel(),
+                    fbs[cross:],
+                    fcs[cross:],
+                )
+            )
+            home_won = rng.random(teams // 2) < special.ndtr(
+                (strength[order[0 : teams // 2 * 2 : 2]] - strength[order[1::2]])
+                / np.sqrt(2)
+            )
+            start = (kickoff + timedelta(weeks=week - 1)).isoformat()
+            for home, away, won in zip(order[::2], order[1::2], home_won):
+                writer.writerow(
+                    [
+                        week,
+                        "regular",
+                        start.replace("+00:00", ".000Z"),
+                        "true",
+                        home,
+                        f"Team {home}",
+                        division[home],
+                        f"{division[home].upper()} {home // 12}",
+                        28 if won else 14,
+                        away,
+                        f"Team {away}",
+                        division[away],
+                        f"{division[away].upper()} {away // 12}",
+                        14 if won else 28,
+                    ]
+                )
+
+
+class CountingIntegrate:
+    # Stands in for scipy.integrate inside brr_math to count integrand calls
+    def __init__(self):
+        self.evaluations = 0
+
+    def quad(self, func: Callable[[float], float], *args, **kwargs):
+        def counted(x: float) -> float:
+            self.evaluations += 1
+            return func(x)
+
+        return integrate.quad(counted, *args, **kwargs)
+
+
+def _fbs_squashed(file: str, week: int) -> list[tuple[str, str]]:
+    @csv2list
+    @add_week_filter(week, file)
+    @add_division_filter("fbs")
+    @columnar()
+    def fbs_squashed(*args):
+        return args
+
+    return fbs_squashed(file)
+
+
+def startup(year: int, week: int) -> float:
+    # Seconds from the first import to the answer, measured in the child so
+    # interpreter startup is left out
+    seconds, modules = json.loads(
+        subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT.format(year=year, week=week)],
+            capture_output=True,
+            check=True,
+            text=True,
+            env=os.environ
+            | {
+                "PYTHONPATH": os.pathsep.join(
+                    filter(None, [REPO, os.environ.get("PYTHONPATH")])
+                )
+            },
+        ).stdout
+    )
+    if loaded := [m for m in modules if m.startswith(STARTUP_FORBIDDEN)]:
+        raise RuntimeError(f"answering from the cache imported {loaded[0]}")
+    return seconds
+
+
+def _run(
+    case: str, season: str, source: str, scratch: str, memory: bool = True
+) -> dict:
+    year = season_year(season)
+    file = f"{year}.csv"
+    workspace = tempfile.mkdtemp(dir=scratch)
+    shutil.copy(source, os.path.join(workspace, file))
+    os.chdir(workspace)
+    week = data.final_week(file)
+    counter = CountingIntegrate()
+    brr_math.integrate = counter
+    games = _fbs_squashed(file, week)
+    # Spread the starting ratings by record so parity has something to fit
+    record = Counter(winner for winner, _ in games)
+    record.subtract(loser for _, loser in games)
+    ratings = {team: (record[team] / 10, 1.0) for game in games for team in game}
+    if case == "startup":
+        with RatingsStore() as cache:
+            key = content_key(games, None, None, None, None, SOLVER_VERSION)
+            cache.put(key, (1e-6, 1.0, ratings))
+            cache.tag(f"{year}w{week:02}fbs", key, file_digest(file), SOLVER_VERSION)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+
+        def run() -> float | None:
+            if case == "load":
+                memo.invalidate()
+                _fbs_squashed(file, week)
+            elif case == "sweep":
+                brr_math.next_ratings(games, 1.0, ratings)
+            elif case == "parity":
+                brr_math.calc_parity(games, ratings)
+            elif case == "startup":
+                return startup(year, week)
+            else:
+                if os.path.exists(CACHE_FILE):
+                    os.remove(CACHE_FILE)
+                if case == "league":
+                    solve_league(file)
+                else:
+                    fbs_with_fcs(year, week)
+
+        times = []
+        for _ in range(REPEATS[case]):
+            counter.evaluations = 0
+            start = time.perf_counter()
+            elapsed = run()
+            times.append(time.perf_counter() - start if elapsed is None else elapsed)
+        evaluations = counter.evaluations
+        # Tracing slows allocation-heavy code, so memory gets its own run
+        peak = 0
+        if memory:
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {
+        "case": case,
+        "season": season,
+        "teams": len(ratings),
+        "games": len(games),
+        "seconds": min(times),
+        "peak_kib": peak // 1024,
+        "integrand_evaluations": evaluations,
+    }
+
+
+def run_benchmarks(matrix: list[tuple[str, str]], memory: bool = True) -> list[dict]:
+    scratch = tempfile.mkdtemp()
+    try:
+        sources = {}
+        for season in {season for _, season in matrix}:
+            if season in SHIPPED:
+                sources[season] = os.path.abspath(f"{SHIPPED[season]}.csv")
+            else:
+                sources[season] = os.path.join(scratch, f"{season_year(season)}.csv")
+                write_synthetic_season(SYNTHETIC[season], sources[season])
+        results = []
+        for case, season in matrix:
+            # A fresh process per case keeps caches and peak memory separate
+            with ProcessPoolExecutor(1) as pool:
+                result = pool.submit(
+                    _run, case, season, sources[season], scratch, memory
+                ).result()
+            results.append(result)
+            print(
+                f"{case:>12} {season:>4}: {result['seconds']:9.3f}s "
+                f"{result['peak_kib']:>9} KiB "
+                f"{result['integrand_evaluations']:>10} evaluations",
+                flush=True,
+            )
+        return results
+    finally:
+        shutil.rmtree(scratch)
+
+
+def regressions(
+    results: list[dict], baseline: list[dict], tolerance: float = TOLERANCE
+) -> list[str]:
+    previous = {(result["case"], result["season"]): result for result in baseline}
+    found = []
+    for result in results:
+        if (base := previous.get((result["case"], result["season"]))) is None:
+            continue
+        for metric in ("seconds", "peak_kib", "integrand_evaluations"):
+            if result[metric] > base[metric] * (1 + tolerance) and result[metric] > 0:
+                found.append(
+                    f"{result['case']} {result['season']}: {metric} "
+                    f"{base[metric]:.4g} -> {result[metric]:.4g}"
+                )
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the rating pipeline")
+    parser.add_argument("--cases", nargs="+", choices=CASES)
+    parser.add_argument("--seasons", nargs="+", choices=[*SHIPPED, *SYNTHETIC])
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument(
+        "--save", action="store_true", help="record these results as the baseline"
+    )
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip the extra traced run that measures peak memory",
+    )
+    args = parser.parse_args()
+    if args.cases or args.seasons:
+        matrix = [
+            (case, season)
+            for case in args.cases or CASES
+            for season in args.seasons or [*SHIPPED, *SYNTHETIC]
+        ]
+    else:
+        matrix = DEFAULT_MATRIX
+    results = run_benchmarks(matrix, not args.no_memory)
+    baseline = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+    found = regressions(results, baseline, args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    if args.save:
+        ran = {(result["case"], result["season"]) for result in results}
+        with open(args.baseline, "w") as file:
+            json.dump(
+                [r for r in baseline if (r["case"], r["season"]) not in ran] + results,
+                file,
+                indent=2,
+            )
+    sys.exit(1 if found and not args.save else 0)
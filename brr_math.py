@@ -1,23 +1,228 @@
+import contextlib
+import functools
+import heapq
+import importlib.util
+import sys
+import time
+import types
 import typing
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
 
 import numpy as np
-import scipy.integrate as integrate
-import scipy.optimize as optimize
-import scipy.special as special
 
+import instrument
+from data import Season
 
-def calc_win_probability(
-    win_team: tuple[float, float], lose_team: tuple[float, float], parity: float
-) -> float:
-    delta = win_team[0] - lose_team[0]
-    sigma = np.sqrt(
+
+def _lazy_import(name: str) -> types.ModuleType:
+    # Executed on first attribute access, so reading cached ratings never pays
+    # for SciPy
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+integrate = _lazy_import("scipy.integrate")
+optimize = _lazy_import("scipy.optimize")
+special = _lazy_import("scipy.special")
+
+# Bump whenever a change to the math moves the fixed point, so that cached
+# ratings solved by older code are recomputed
+SOLVER_VERSION = "3"
+
+
+# A rating or any broadcastable arrays of them, as (mean, sigma)
+type Rating = tuple[float | np.ndarray, float | np.ndarray]
+
+
+def _win_score(win_team: Rating, lose_team: Rating, parity: float) -> np.ndarray:
+    return np.subtract(win_team[0], lose_team[0]) / np.sqrt(
         np.square(parity) + np.square(win_team[1]) + np.square(lose_team[1])
     )
-    return special.erf(delta / (np.sqrt(2) * sigma)) / 2 + 0.5
+
+
+def calc_win_probability(
+    win_team: Rating, lose_team: Rating, parity: float
+) -> float | np.ndarray:
+    return special.ndtr(_win_score(win_team, lose_team, parity))
+
+
+# Stays finite where calc_win_probability underflows, so long schedules can be
+# summed instead of multiplied
+def log_win_probability(
+    win_team: Rating, lose_team: Rating, parity: float
+) -> float | np.ndarray:
+    return special.log_ndtr(_win_score(win_team, lose_team, parity))
+
+
+def win_probability_matrix(
+    mean: np.ndarray, sigma: np.ndarray, parity: float, log: bool = False
+) -> np.ndarray:
+    # Entry [i, j] is the chance that team i beats team j
+    probability = log_win_probability if log else calc_win_probability
+    return probability(
+        (mean[:, None], sigma[:, None]), (mean[None, :], sigma[None, :]), parity
+    )
+
+
+def head_to_head(
+    ratings: dict[str, tuple[float, float]],
+    parity: float,
+    teams: list[str] | None = None,
+) -> tuple[list[str], np.ndarray]:
+    names = list(teams or ratings)
+    mean, sigma = np.array([ratings[team] for team in names], dtype=np.float64).T
+    return names, win_probability_matrix(mean, sigma, parity)
+
+
+class Schedule:
+    def __init__(
+        self,
+        season: Sequence[tuple[str, str]],
+        ratings: dict[str, tuple[float, float]],
+    ):
+        if isinstance(season, Season):
+            self.index = season.index.copy()
+            for team in ratings:
+                self.index.setdefault(team, len(self.index))
+            self.winners, self.losers = season.winners, season.losers
+        else:
+            self.index = {team: i for i, team in enumerate(ratings)}
+            self.winners = np.array(
+                [self.index[game[0]] for game in season], dtype=np.int32
+            )
+            self.losers = np.array(
+                [self.index[game[1]] for game in season], dtype=np.int32
+            )
+        # CSR adjacency: the opponents team i beat are
+        # wins[win_offsets[i]:win_offsets[i + 1]], and likewise for losses
+        self.win_offsets, self.wins = self._adjacency(self.winners, self.losers)
+        self.loss_offsets, self.losses = self._adjacency(self.losers, self.winners)
+
+    def _adjacency(
+        self, teams: np.ndarray, opponents: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(teams, kind="stable")
+        offsets = np.zeros(len(self.index) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(teams, minlength=len(self.index)), out=offsets[1:])
+        return offsets, opponents[order]
+
+    def wins_of(self, team: int) -> np.ndarray:
+        return self.wins[self.win_offsets[team] : self.win_offsets[team + 1]]
+
+    def losses_of(self, team: int) -> np.ndarray:
+        return self.losses[self.loss_offsets[team] : self.loss_offsets[team + 1]]
+
+    def arrays(
+        self, ratings: dict[str, tuple[float, float]]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        mean, sigma = (
+            np.array([ratings[team] for team in self.index], dtype=np.float64)
+            .reshape(-1, 2)
+            .T
+        )
+        return mean, sigma
+
+
+def _parity_terms(
+    parity: float, delta: np.ndarray, sigma: np.ndarray
+) -> tuple[float, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Closed form of the per-game integral in calc_parity: with Y ~ N(-delta, sigma)
+    # and a = 1 / (sqrt(2) * parity), E[Phi(aY)^2] is a bivariate normal orthant
+    # probability, Phi(h) - 2 T(h, alpha) in terms of Owen's T function
+    a = 1 / (np.sqrt(2) * parity)
+    c = np.square(a) * sigma
+    h = -a * delta / np.sqrt(1 + c)
+    alpha = 1 / np.sqrt(1 + 2 * c)
+    return a, c, h, alpha, 1 / np.sqrt(sigma)
+
+
+def parity_value(parity: float, delta: np.ndarray, sigma: np.ndarray) -> float:
+    _, _, h, alpha, weight = _parity_terms(parity, delta, sigma)
+    return float((weight * (special.ndtr(h) - 2 * special.owens_t(h, alpha))).sum())
+
+
+def parity_slope(parity: float, delta: np.ndarray, sigma: np.ndarray) -> float:
+    # The derivative needs no Owen's T, only normal densities and CDFs
+    a, c, h, alpha, weight = _parity_terms(parity, delta, sigma)
+    d_value_d_a = weight * (
+        2
+        * np.exp(-np.square(h) / 2)
+        / np.sqrt(2 * np.pi)
+        * special.ndtr(h * alpha)
+        * -delta
+        / (1 + c) ** 1.5
+        + np.exp(-np.square(h) * (1 + c) / (1 + 2 * c))
+        * a
+        * sigma
+        * alpha
+        / (np.pi * (1 + c))
+    )
+    return float(d_value_d_a.sum() * -a / parity)
+
+
+def parity_curve(
+    parity: float, delta: np.ndarray, sigma: np.ndarray
+) -> tuple[float, float]:
+    return parity_value(parity, delta, sigma), parity_slope(parity, delta, sigma)
+
+
+def solve_parity(delta: np.ndarray, sigma: np.ndarray) -> float:
+    def slope(p: float) -> float:
+        return parity_slope(p, delta, sigma)
+
+    low, high = 0.5, 5.0
+    while slope(low) > 0 and low > 0.05:
+        low /= 2
+    while slope(high) < 0 and high < 1e10:
+        high *= 10
+    if slope(low) < 0 < slope(high):
+        parity, result = optimize.brentq(slope, low, high, full_output=True)
+        instrument.emit(
+            "parity",
+            parity=parity,
+            method="brentq",
+            evaluations=result.function_calls,
+            converged=result.converged,
+        )
+    else:
+        result = optimize.minimize_scalar(
+            lambda p: parity_value(p, delta, sigma), (0.5, 5)
+        )
+        parity = result.x
+        instrument.emit(
+            "parity",
+            parity=parity,
+            method="minimize_scalar",
+            evaluations=result.nfev,
+            converged=bool(result.success),
+        )
+    return parity
 
 
 def calc_parity(
-    season: list[tuple[str, str]], ratings: dict[str, tuple[float, float]]
+    season: Sequence[tuple[str, str]],
+    ratings: dict[str, tuple[float, float]],
+    method: str = "closed",
+    schedule: Schedule | None = None,
+) -> float:
+    if method == "quad":
+        return quad_parity(season, ratings)
+    if schedule is None:
+        schedule = Schedule(season, ratings)
+    return schedule_parity(schedule, *schedule.arrays(ratings))
+
+
+def quad_parity(
+    season: Sequence[tuple[str, str]], ratings: dict[str, tuple[float, float]]
 ) -> float:
     def difficulty_of_fit(y: float, parity: float, winner: str, loser: str) -> float:
         sigma = np.sqrt(np.square(ratings[loser][1]) + np.square(ratings[winner][1]))
@@ -38,7 +243,13 @@ def calc_parity(
 
     result = optimize.minimize_scalar(curve, (0.5, 5))
     # Bracket found using calc_parity([('B', 'A')], {'A': (0, 1), 'B': (0, 1)}) was (.05, 1e10)
-    print(result)
+    instrument.emit(
+        "parity",
+        parity=result.x,
+        method="quad",
+        evaluations=result.nfev,
+        converged=bool(result.success),
+    )
     return result.x
 
 
@@ -52,79 +263,663 @@ def calc_parity(
 # )
 
 
+# Each posterior is integrated where its density is within e^-LOG_WINDOW of the
+# peak; the mass outside is below the quadrature error
+LOG_WINDOW = 40.0
+
+
 # The initial prior is that every team is a standard normal distribution
+def quad_posterior(
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    team: int,
+) -> tuple[float, float]:
+    wins = schedule.wins_of(team)
+    losses = schedule.losses_of(team)
+
+    def log_density(rating: float) -> float:
+        return float(
+            -np.square(rating) / 2
+            + log_win_probability((rating, 0), (mean[wins], sigma[wins]), parity).sum()
+            + log_win_probability(
+                (mean[losses], sigma[losses]), (rating, 0), parity
+            ).sum()
+        )
+
+    # The prior makes the log density at least 1-strongly concave, so it has a
+    # single mode and falls off at least as fast as N(mode, 1) on either side
+    mode = optimize.minimize_scalar(lambda x: -log_density(x), (-1, 1)).x
+    peak = log_density(mode)
+
+    def edge(direction: int) -> float:
+        # The root lies between the last point inside the window (the mode at
+        # first) and the first point outside it; a sharp posterior can leave
+        # the window within the first step
+        inside, step = mode, 1.0
+        while log_density(mode + direction * step) - peak > -LOG_WINDOW:
+            inside = mode + direction * step
+            step *= 2
+        return optimize.brentq(
+            lambda x: log_density(x) - peak + LOG_WINDOW,
+            inside,
+            mode + direction * step,
+            xtol=1e-3,
+        )
+
+    low, high = edge(-1), edge(1)
+
+    def density(x: float) -> float:
+        return np.exp(log_density(x) - peak)
+
+    denominator = integrate.quad(density, low, high, points=(mode,))
+    numerator = integrate.quad(lambda x: x * density(x), low, high, points=(mode,))
+    rating = numerator[0] / denominator[0]
+    variance_numerator = integrate.quad(
+        lambda x: np.square(rating - x) * density(x), low, high, points=(mode,)
+    )
+    return rating, np.sqrt(variance_numerator[0] / denominator[0])
+
+
+_worker: dict[str, typing.Any] = {}
+
+
+def _init_worker(schedule: Schedule, shared_name: str) -> None:
+    _worker["schedule"] = schedule
+    _worker["memory"] = shared_memory.SharedMemory(shared_name)
+    _worker["ratings"] = np.ndarray(
+        (2, len(schedule.index)), dtype=np.float64, buffer=_worker["memory"].buf
+    )
+
+
+def _posterior_shard(parity: float, teams: list[int]) -> list[tuple[float, float]]:
+    mean, sigma = _worker["ratings"]
+    return [
+        quad_posterior(_worker["schedule"], mean, sigma, parity, team) for team in teams
+    ]
+
+
+class TeamPool:
+    # Worker processes receive the schedule once and read each iteration's
+    # ratings from shared memory, so tasks only carry team indices
+    def __init__(self, schedule: Schedule, workers: int):
+        self.workers = workers
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=max(16 * len(schedule.index), 1)
+        )
+        self.ratings = np.ndarray(
+            (2, len(schedule.index)), dtype=np.float64, buffer=self.memory.buf
+        )
+        self.executor = ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(schedule, self.memory.name)
+        )
+
+    def posteriors(
+        self, mean: np.ndarray, sigma: np.ndarray, parity: float, teams: list[int]
+    ) -> list[tuple[float, float]]:
+        self.ratings[0] = mean
+        self.ratings[1] = sigma
+        shards = [teams[i :: self.workers] for i in range(self.workers)]
+        results = list(self.executor.map(_posterior_shard, repeat(parity), shards))
+        posteriors: list[tuple[float, float]] = [(0.0, 0.0)] * len(teams)
+        for i, shard in enumerate(results):
+            posteriors[i :: self.workers] = shard
+        return posteriors
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        del self.ratings
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self) -> "TeamPool":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def quad_sweep(
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    update: np.ndarray,
+    pool: TeamPool | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    # quad_posterior integrates three times per team
+    with instrument.phase(
+        "sweep", engine="quad", teams=len(update), quad_calls=3 * len(update)
+    ):
+        if pool is None:
+            posteriors = [
+                quad_posterior(schedule, mean, sigma, parity, i)
+                for i in update.tolist()
+            ]
+        else:
+            posteriors = pool.posteriors(mean, sigma, parity, update.tolist())
+    mean, sigma = mean.copy(), sigma.copy()
+    for i, posterior in zip(update.tolist(), posteriors):
+        mean[i], sigma[i] = posterior
+    return mean, sigma
+
+
 def next_ratings(
-    season: list[tuple[str, str]],
+    season: Sequence[tuple[str, str]],
     parity: float,
     current_ratings: dict[str, tuple[float, float]],
     teams: list[str] | None = None,
+    schedule: Schedule | None = None,
+    pool: TeamPool | None = None,
 ) -> dict[str, tuple[float, float]]:
-    def season_probability(team: str, rating: float) -> float:
-        games = []
-        for game in filter(lambda x: team in x, season):
-            if game[0] == team:
-                winner = (rating, 0)
-                loser = current_ratings[game[1]]
-            else:
-                winner = current_ratings[game[0]]
-                loser = (rating, 0)
-            games.append(calc_win_probability(winner, loser, parity))
-        return typing.cast(float, np.prod(games))
+    if schedule is None:
+        schedule = Schedule(season, current_ratings)
+    mean, sigma = schedule.arrays(current_ratings)
+    names = list(teams or current_ratings)
+    update = np.array([schedule.index[team] for team in names], dtype=np.intp)
+    mean, sigma = quad_sweep(schedule, mean, sigma, parity, update, pool)
+    ratings = current_ratings.copy()
+    for team, i in zip(names, update.tolist()):
+        ratings[team] = (float(mean[i]), float(sigma[i]))
+    return ratings
+
+
+GRID_NODES = 64
+# Bumped when a change moves only the grid engine's fixed point
+GRID_VERSION = "2"
+GRID_NEWTON_STEPS = 100
+
+
+@functools.cache
+def legendre_grid(nodes: int) -> tuple[np.ndarray, np.ndarray]:
+    # Nodes and weights for integrating over [-1, 1]
+    return np.polynomial.legendre.leggauss(nodes)
+
+
+def _grid_moments(
+    log_density: np.ndarray, x: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    density = np.exp(log_density - log_density.max(axis=-1, keepdims=True))
+    denominator = density.sum(axis=-1)
+    rating = (density * x).sum(axis=-1) / denominator
+    variance = (density * np.square(x - rating[..., None])).sum(axis=-1) / denominator
+    return rating, np.sqrt(variance)
+
+
+class _BlockPosterior:
+    # The log posteriors of a block of teams, where game g adds
+    # log Phi((x - centre[g]) / scale[g]) to team owner[g]; a loss is a win
+    # with the scale negated. The prior keeps every curvature at or below -1
+    def __init__(self, owner: np.ndarray, centre: np.ndarray, scale: np.ndarray):
+        self.owner = owner
+        self.centre = centre
+        self.scale = scale
+
+    def __call__(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Value, slope and curvature at one point per team
+        teams = len(x)
+        u = (x[self.owner] - self.centre) / self.scale
+        log_cdf = special.log_ndtr(u)
+        ratio = np.exp(-np.square(u) / 2 - np.log(np.sqrt(2 * np.pi)) - log_cdf)
+        value = np.bincount(self.owner, log_cdf, teams) - np.square(x) / 2
+        slope = np.bincount(self.owner, ratio / self.scale, teams) - x
+        curvature = -1 - np.bincount(
+            self.owner, ratio * (u + ratio) / np.square(self.scale), teams
+        )
+        return value, slope, curvature
+
+    def nodes(self, x: np.ndarray) -> np.ndarray:
+        # The log posterior at every (team, node) of x
+        teams = len(x)
+        played = np.bincount(self.owner, minlength=teams)
+        log_density = -np.square(x) / 2
+        if played.any():
+            log_density[played > 0] += np.add.reduceat(
+                special.log_ndtr(
+                    (x[self.owner] - self.centre[:, None]) / self.scale[:, None]
+                ),
+                (np.cumsum(played) - played)[played > 0],
+                axis=0,
+            )
+        return log_density
+
+    def mode(self, start: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Newton's method from start; returns each mode, the log posterior there
+        # and the Laplace width
+        mode = start.copy()
+        for _ in range(GRID_NEWTON_STEPS):
+            _, slope, curvature = self(mode)
+            step = slope / curvature
+            mode -= step
+            if np.abs(step).max(initial=0.0) < 1e-12:
+                break
+        return mode, self(mode)[0], 1 / np.sqrt(-curvature)
+
+    def edge(
+        self, mode: np.ndarray, peak: np.ndarray, width: np.ndarray, direction: int
+    ) -> np.ndarray:
+        # Where each log posterior falls LOG_WINDOW below its peak. The search
+        # starts outside the window, where Newton's method on a concave
+        # function moves monotonically in to the root
+        offset = np.sqrt(2 * LOG_WINDOW) * width
+        while (inside := self(mode + direction * offset)[0] - peak > -LOG_WINDOW).any():
+            offset[inside] *= 2
+        x = mode + direction * offset
+        for _ in range(GRID_NEWTON_STEPS):
+            value, slope, _ = self(x)
+            step = (value - peak + LOG_WINDOW) / slope
+            x -= step
+            if np.abs(step).max(initial=0.0) < 1e-3:
+                break
+        return x
+
+
+def _grid_block(
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    start: int,
+    stop: int,
+    nodes: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Posterior moments of teams start:stop by Gauss-Legendre quadrature over
+    # the window quad_posterior integrates, found for each team at once, so
+    # sharp and lopsided posteriors are sampled as finely as broad ones
+    owners, centres, scales = [], [], []
+    for offsets, opponents, sign in (
+        (schedule.win_offsets, schedule.wins, 1.0),
+        (schedule.loss_offsets, schedule.losses, -1.0),
+    ):
+        block = offsets[start : stop + 1]
+        faced = opponents[block[0] : block[-1]]
+        owners.append(np.repeat(np.arange(stop - start), np.diff(block)))
+        centres.append(mean[faced])
+        scales.append(sign * np.sqrt(np.square(parity) + np.square(sigma[faced])))
+    # Grouped by team, so each team's games are one run for reduceat
+    order = np.argsort(np.concatenate(owners), kind="stable")
+    posterior = _BlockPosterior(
+        np.concatenate(owners)[order],
+        np.concatenate(centres)[order],
+        np.concatenate(scales)[order],
+    )
+    mode, peak, width = posterior.mode(mean[start:stop])
+    low = posterior.edge(mode, peak, width, -1)
+    high = posterior.edge(mode, peak, width, 1)
+    z, w = legendre_grid(nodes)
+    x = (low + high)[:, None] / 2 + (high - low)[:, None] / 2 * z
+    return _grid_moments(posterior.nodes(x) + np.log(w), x)
+
+
+# Bytes the grid engine may hold per block of teams; each game a block plays
+# costs a few (games, nodes) arrays of float64
+GRID_MEMORY = 64 * 2**20
+_GRID_ARRAYS = 4
 
+
+def _team_blocks(schedule: Schedule, games: int) -> Iterator[tuple[int, int]]:
+    # Runs of consecutive teams playing at most games games between them (a
+    # team with more gets a block of its own)
+    played = schedule.win_offsets + schedule.loss_offsets
+    start = 0
+    while start < len(played) - 1:
+        stop = int(np.searchsorted(played, played[start] + games, side="right")) - 1
+        stop = min(max(stop, start + 1), len(played) - 1)
+        yield start, stop
+        start = stop
+
+
+def grid_posterior(
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    nodes: int = GRID_NODES,
+    memory: int = GRID_MEMORY,
+) -> tuple[np.ndarray, np.ndarray]:
+    rating = np.empty(len(mean))
+    deviation = np.empty(len(mean))
+    games = max(1, memory // (nodes * np.dtype(np.float64).itemsize * _GRID_ARRAYS))
+    for start, stop in _team_blocks(schedule, games):
+        rating[start:stop], deviation[start:stop] = _grid_block(
+            schedule, mean, sigma, parity, start, stop, nodes
+        )
+    return rating, deviation
+
+
+def grid_team_posterior(
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    team: int,
+    nodes: int = GRID_NODES,
+) -> tuple[float, float]:
+    rating, deviation = _grid_block(
+        schedule, mean, sigma, parity, team, team + 1, nodes
+    )
+    return float(rating[0]), float(deviation[0])
+
+
+def grid_sweep(
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    update: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    with instrument.phase("sweep", engine="grid", teams=len(update), quad_calls=0):
+        rating, deviation = grid_posterior(schedule, mean, sigma, parity)
+    mean, sigma = mean.copy(), sigma.copy()
+    mean[update] = rating[update]
+    sigma[update] = deviation[update]
+    return mean, sigma
+
+
+def grid_ratings(
+    season: Sequence[tuple[str, str]],
+    parity: float,
+    current_ratings: dict[str, tuple[float, float]],
+    teams: list[str] | None = None,
+    schedule: Schedule | None = None,
+    nodes: int = GRID_NODES,
+) -> dict[str, tuple[float, float]]:
+    if schedule is None:
+        schedule = Schedule(season, current_ratings)
+    mean, sigma = schedule.arrays(current_ratings)
+    rating, deviation = grid_posterior(schedule, mean, sigma, parity, nodes)
     ratings = current_ratings.copy()
     for team in teams or current_ratings:
-        numerator = integrate.quad(
-            lambda x: x
-            * np.exp(-np.square(x) / 2)
-            / np.sqrt(2 * np.pi)
-            * season_probability(team, x),
-            -np.inf,
-            np.inf,
-        )
-        denominator = integrate.quad(
-            lambda x: np.exp(-np.square(x) / 2)
-            / np.sqrt(2 * np.pi)
-            * season_probability(team, x),
-            -np.inf,
-            np.inf,
-        )
-        rating = numerator[0] / denominator[0]
-        variance_numerator = integrate.quad(
-            lambda x: np.square(rating - x)
-            * np.exp(-np.square(x) / 2)
-            / np.sqrt(2 * np.pi)
-            * season_probability(team, x),
-            -np.inf,
-            np.inf,
-        )
-        ratings[team] = (rating, np.sqrt(variance_numerator[0] / denominator[0]))
-        print(
-            f"{team}: {tuple(map(lambda x: float(typing.cast(np.float64, x)), ratings[team]))}"
-        )
+        i = schedule.index[team]
+        ratings[team] = (float(rating[i]), float(deviation[i]))
     return ratings
 
 
+POSTERIORS = {"quad": quad_posterior, "grid": grid_team_posterior}
+
+
+def gauss_seidel_sweep(
+    engine: str,
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    update: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Each team sees the ratings already updated earlier in the same sweep
+    posterior = POSTERIORS[engine]
+    mean, sigma = mean.copy(), sigma.copy()
+    with instrument.phase(
+        "sweep",
+        engine=engine,
+        teams=len(update),
+        quad_calls=3 * len(update) if engine == "quad" else 0,
+    ):
+        for i in update.tolist():
+            mean[i], sigma[i] = posterior(schedule, mean, sigma, parity, i)
+    return mean, sigma
+
+
+WORKLIST_TOLERANCE = 1e-2
+
+
+def worklist_solve(
+    engine: str,
+    schedule: Schedule,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    update: np.ndarray,
+    dirty: np.ndarray,
+    convergence: float,
+    history: list[float],
+) -> tuple[np.ndarray, np.ndarray, float]:
+    # Recomputes only the teams whose inputs changed, and each opponent of a
+    # team whose rating then moves by more than the convergence; parity waits
+    # until the worklist empties, and touches every team if it moves
+    posterior = POSTERIORS[engine]
+    mean, sigma = mean.copy(), sigma.copy()
+    updatable = np.zeros(len(mean), dtype=bool)
+    updatable[update] = True
+
+    def opponents(team: int) -> list[int]:
+        adjacent = np.concatenate((schedule.wins_of(team), schedule.losses_of(team)))
+        return adjacent[updatable[adjacent]].tolist()
+
+    # Teams held fixed cannot be recomputed, so their opponents are instead
+    start = {
+        team for i in dirty.tolist() for team in ([i] if updatable[i] else opponents(i))
+    }
+    # Early rounds only pass on moves above a looser tolerance, since the parity
+    # solved after them will move every team again anyway
+    tolerance = max(convergence, WORKLIST_TOLERANCE)
+    while True:
+        # Teams whose opponents moved most go first; pending holds the largest
+        # move each queued team has yet to see, so stale heap entries are skipped
+        pending = dict.fromkeys(start, np.inf)
+        heap = [(-np.inf, team) for team in sorted(start)]
+        held: set[int] = set()
+        moved = 0.0
+        updates = 0
+        while heap:
+            priority, i = heapq.heappop(heap)
+            if pending.get(i) != -priority:
+                continue
+            del pending[i]
+            held.discard(i)
+            rating, sigma[i] = posterior(schedule, mean, sigma, parity, i)
+            change = abs(rating - mean[i])
+            mean[i] = rating
+            moved = max(moved, change)
+            updates += 1
+            if change > tolerance:
+                for j in opponents(i):
+                    if change > pending.get(j, 0.0):
+                        pending[j] = change
+                        heapq.heappush(heap, (-change, j))
+            elif change > convergence:
+                held.update(opponents(i))
+        next_parity = schedule_parity(schedule, mean, sigma)
+        history.append(max(moved, abs(next_parity - parity)))
+        instrument.emit(
+            "worklist", updates=updates, residual=history[-1], parity=next_parity
+        )
+        parity_moved = abs(next_parity - parity)
+        parity = next_parity
+        if parity_moved < convergence and not held:
+            return mean, sigma, parity
+        tolerance = max(convergence, min(tolerance, parity_moved) / 10)
+        start = set(update.tolist()) if parity_moved >= convergence else held
+
+
+def schedule_parity(schedule: Schedule, mean: np.ndarray, sigma: np.ndarray) -> float:
+    winners, losers = schedule.winners, schedule.losers
+    with instrument.phase("parity", games=len(winners)):
+        return solve_parity(
+            mean[winners] - mean[losers], np.hypot(sigma[winners], sigma[losers])
+        )
+
+
+ANDERSON_MEMORY = 5
+ANDERSON_DAMPING = 0.5
+type Step = Callable[
+    [np.ndarray, np.ndarray, float], tuple[np.ndarray, np.ndarray, float]
+]
+
+
+def fixed_point(
+    step: Step,
+    mean: np.ndarray,
+    sigma: np.ndarray,
+    parity: float,
+    update: np.ndarray,
+    convergence: float,
+    solver: str = "jacobi",
+    history: list[float] | None = None,
+) -> tuple[np.ndarray, np.ndarray, float]:
+    if history is None:
+        history = []
+    n = len(update)
+
+    def pack(mean: np.ndarray, sigma: np.ndarray, parity: float) -> np.ndarray:
+        return np.concatenate((mean[update], sigma[update], [parity]))
+
+    def unpack(z: np.ndarray) -> tuple[np.ndarray, np.ndarray, float]:
+        new_mean, new_sigma = mean.copy(), sigma.copy()
+        new_mean[update] = z[:n]
+        new_sigma[update] = np.maximum(z[n : 2 * n], np.finfo(np.float64).tiny)
+        return new_mean, new_sigma, max(float(z[-1]), np.finfo(np.float64).tiny)
+
+    # Only the means and parity decide convergence, as in the plain iteration
+    def residual(f: np.ndarray) -> float:
+        return max(float(np.abs(f[:n]).max(initial=0)), abs(float(f[-1])))
+
+    if solver != "anderson":
+        while True:
+            next_mean, next_sigma, next_parity = step(mean, sigma, parity)
+            history.append(
+                max(
+                    float(np.abs(next_mean - mean).max(initial=0)),
+                    abs(next_parity - parity),
+                )
+            )
+            mean, sigma, parity = next_mean, next_sigma, next_parity
+            instrument.emit(
+                "iteration", iteration=len(history), residual=history[-1], parity=parity
+            )
+            if history[-1] < convergence:
+                return mean, sigma, parity
+
+    z = pack(mean, sigma, parity)
+    g = pack(*step(mean, sigma, parity))
+    f = g - z
+    delta_g: list[np.ndarray] = []
+    delta_f: list[np.ndarray] = []
+    while True:
+        history.append(residual(f))
+        instrument.emit(
+            "iteration",
+            iteration=len(history),
+            residual=history[-1],
+            parity=float(g[-1]),
+        )
+        if history[-1] < convergence:
+            return unpack(g)
+        if delta_f:
+            gamma = np.linalg.lstsq(np.column_stack(delta_f), f, rcond=None)[0]
+            candidate = g - np.column_stack(delta_g) @ gamma
+        else:
+            candidate = g
+        candidate = pack(*unpack(candidate))
+        next_g = pack(*step(*unpack(candidate)))
+        next_f = next_g - candidate
+        if delta_f and residual(next_f) > residual(f):
+            # The extrapolated step diverged: restart from a damped plain step
+            delta_g.clear()
+            delta_f.clear()
+            candidate = pack(*unpack(z + ANDERSON_DAMPING * f))
+            next_g = pack(*step(*unpack(candidate)))
+            next_f = next_g - candidate
+        delta_g.append(next_g - g)
+        delta_f.append(next_f - f)
+        del delta_g[:-ANDERSON_MEMORY], delta_f[:-ANDERSON_MEMORY]
+        z, g, f = candidate, next_g, next_f
+
+
 def iter_ratings(
-    season: list[tuple[str, str]],
+    season: Sequence[tuple[str, str]],
     convergence: float = 1e-3,
     parity: float = 1.0,
     ratings: dict[str, tuple[float, float]] | None = None,
     teams: list[str] | None = None,
+    engine: str = "quad",
+    workers: int | None = None,
+    solver: str = "jacobi",
+    history: list[float] | None = None,
+    dirty: list[str] | None = None,
 ) -> tuple[float, float, dict[str, tuple[float, float]]]:
     if ratings is None:
-        ratings = {team: (0.0, 1.0) for game in season for team in game}
-    while True:
-        prev_ratings = ratings
-        prev_parity = parity
-        ratings = next_ratings(season, parity, ratings, teams)
-        parity = calc_parity(season, ratings)
-        if (
-            all(
-                map(
-                    lambda t: abs(ratings[t][0] - prev_ratings[t][0]) < convergence,
-                    ratings,
+        teams_played = (
+            season.teams
+            if isinstance(season, Season)
+            else (team for game in season for team in game)
+        )
+        ratings = {team: (0.0, 1.0) for team in teams_played}
+    if history is None:
+        history = []
+    start = time.perf_counter()
+    schedule = Schedule(season, ratings)
+    mean, sigma = schedule.arrays(ratings)
+    update = np.array(
+        [schedule.index[team] for team in teams or ratings], dtype=np.intp
+    )
+    parallel = (
+        engine == "quad"
+        and solver not in ("gauss-seidel", "worklist")
+        and workers is not None
+        and workers > 1
+    )
+    instrument.emit(
+        "solve_start",
+        teams=len(update),
+        games=len(schedule.winners),
+        engine=engine,
+        solver=solver,
+        workers=workers if parallel else 1,
+    )
+    with TeamPool(schedule, workers) if parallel else contextlib.nullcontext() as pool:
+
+        def step(
+            mean: np.ndarray, sigma: np.ndarray, parity: float
+        ) -> tuple[np.ndarray, np.ndarray, float]:
+            if solver == "gauss-seidel":
+                mean, sigma = gauss_seidel_sweep(
+                    engine, schedule, mean, sigma, parity, update
                 )
+            elif engine == "grid":
+                mean, sigma = grid_sweep(schedule, mean, sigma, parity, update)
+            else:
+                mean, sigma = quad_sweep(schedule, mean, sigma, parity, update, pool)
+            return mean, sigma, schedule_parity(schedule, mean, sigma)
+
+        if solver == "worklist":
+            mean, sigma, parity = worklist_solve(
+                engine,
+                schedule,
+                mean,
+                sigma,
+                parity,
+                update,
+                (
+                    update
+                    if dirty is None
+                    else np.array(
+                        [schedule.index[team] for team in dirty], dtype=np.intp
+                    )
+                ),
+                convergence,
+                history,
+            )
+        else:
+            mean, sigma, parity = fixed_point(
+                step, mean, sigma, parity, update, convergence, solver, history
             )
-            and abs(parity - prev_parity) < convergence
-        ):
-            return convergence, parity, ratings
+    instrument.emit(
+        "solve_end",
+        iterations=len(history),
+        residual=history[-1],
+        parity=parity,
+        seconds=time.perf_counter() - start,
+    )
+    return (
+        convergence,
+        parity,
+        {
+            team: (
+                float(mean[schedule.index[team]]),
+                float(sigma[schedule.index[team]]),
+            )
+            for team in ratings
+        },
+    )
@@ -0,0 +1,368 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from collections.abc import Iterable
+from typing import NamedTuple
+
+import numpy as np
+
+from data import TEAM_NAME_LENGTH
+from memo import LRU
+
+CACHE_FILE = "RatingsCache.sqlite3"
+LEGACY_CACHE_FILE = "RatingsCache.json"
+SNAPSHOT_DIR = "RatingsSnapshots"
+type Entry = tuple[float, float, dict[str, tuple[float, float]]]
+# Entries are immutable under their content key, so only puts invalidate these
+_digests = LRU("digests", 256)  # (path, mtime, size) -> file_digest
+_entries = LRU("entries", 32, 256 * 2**20)  # (database, key) -> Entry
+_ratings = LRU("ratings", 64, 256 * 2**20)  # (snapshot dir, key) -> ratings
+
+
+def content_key(
+    games: Iterable[tuple[str, str]],
+    convergence: float | None,
+    parity: float | None,
+    ratings: dict[str, tuple[float, float]] | None,
+    teams: list[str] | None,
+    version: str,
+) -> str:
+    # Everything that decides the fixed point goes into the key, but not the
+    # warm start used to reach it
+    digest = hashlib.sha256(f"v{version}\n".encode())
+    for winner, loser in games:
+        digest.update(f"{winner}\t{loser}\n".encode())
+    digest.update(
+        json.dumps(
+            [
+                convergence,
+                parity,
+                sorted(
+                    (team, list(map(float, r))) for team, r in (ratings or {}).items()
+                ),
+                sorted(teams) if teams else None,
+            ]
+        ).encode()
+    )
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if (digest := _digests.get(memo_key)) is None:
+        with open(path, "rb") as file:
+            digest = _digests.put(
+                memo_key, hashlib.file_digest(file, "sha256").hexdigest()
+            )
+    return digest
+
+
+class Snapshot(NamedTuple):
+    teams: np.ndarray
+    mean: np.ndarray
+    sigma: np.ndarray
+
+    def names(self) -> np.ndarray:
+        # Team names without the id columns and padding
+        return np.char.strip(self.teams.astype(f"U{TEAM_NAME_LENGTH}"))
+
+    def ratings(self) -> dict[str, tuple[float, float]]:
+        return dict(
+            zip(self.names().tolist(), zip(self.mean.tolist(), self.sigma.tolist()))
+        )
+
+
+# A snapshot is a fixed-width array of team keys and a (2, teams) float64 array
+# of means and sigmas, each an .npy file that readers memory-map
+def write_snapshot(
+    directory: str, key: str, ratings: dict[str, tuple[float, float]]
+) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key)
+    # Each writer has its own temporary files, since backfill workers and
+    # readers filling in missing snapshots can write the same key at once
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    np.save(temporary + ".teams.npy", np.array(list(ratings), dtype=str))
+    np.save(
+        temporary + ".ratings.npy",
+        np.array(list(ratings.values()), dtype=np.float64).reshape(-1, 2).T.copy(),
+    )
+    os.replace(temporary + ".teams.npy", path + ".teams.npy")
+    os.replace(temporary + ".ratings.npy", path + ".ratings.npy")
+
+
+def read_snapshot(directory: str, key: str) -> Snapshot | None:
+    path = os.path.join(directory, key)
+    try:
+        teams = np.load(path + ".teams.npy", mmap_mode="r")
+        mean, sigma = np.load(path + ".ratings.npy", mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    return Snapshot(teams, mean, sigma)
+
+
+class RatingsStore:
+    def __init__(
+        self,
+        path: str = CACHE_FILE,
+        legacy_path: str = LEGACY_CACHE_FILE,
+        snapshot_dir: str = SNAPSHOT_DIR,
+    ):
+        self.path = os.path.abspath(path)
+        self.snapshot_dir = snapshot_dir
+        # sqlite3 serializes writers across processes; WAL keeps readers from
+        # blocking on a writer and makes every put a single atomic commit
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS ratings ("
+            "key TEXT PRIMARY KEY, "
+            "convergence REAL NOT NULL, "
+            "parity REAL NOT NULL, "
+            "ratings TEXT NOT NULL, "
+            "warm_start TEXT)"
+        )
+        # Tags like 2024w21fbs name the latest entry solved for them, along with
+        # the digest of the games file and the solver version it came from
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tags ("
+            "tag TEXT PRIMARY KEY, "
+            "key TEXT NOT NULL, "
+            "source TEXT, "
+            "version TEXT)"
+        )
+        if "version" not in {
+            column[1] for column in self.connection.execute("PRAGMA table_info(tags)")
+        }:
+            # Tags written before versions were recorded are left without one
+            try:
+                self.connection.execute("ALTER TABLE tags ADD COLUMN version TEXT")
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS migrations (source TEXT PRIMARY KEY)"
+        )
+        # Read-only opens check for finished migrations without the write lock
+        if not self._migrated("tags"):
+            self._migrate_tag_keys()
+        if os.path.exists(legacy_path) and not self._migrated(
+            os.path.abspath(legacy_path)
+        ):
+            self.migrate(legacy_path)
+
+    def _migrated(self, source: str) -> bool:
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM migrations WHERE source = ?", (source,)
+            ).fetchone()
+            is not None
+        )
+
+    def _migrate_tag_keys(self) -> None:
+        # Entries written before content keys were stored under their tag
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._migrated("tags"):
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO tags (tag, key) SELECT key, key FROM ratings"
+                )
+                self.connection.execute("INSERT INTO migrations VALUES ('tags')")
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def migrate(self, legacy_path: str) -> None:
+        source = os.path.abspath(legacy_path)
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._migrated(source):
+                with open(legacy_path, "r") as legacy_file:
+                    text = legacy_file.read()
+                try:
+                    # The old cache rewrote the file without truncating it, so
+                    # a shorter dump can be followed by the tail of a longer one
+                    legacy = json.JSONDecoder().raw_decode(text.lstrip())[0]
+                except json.JSONDecodeError as error:
+                    logging.getLogger("brr").warning(
+                        "Skipping unreadable %s: %s", legacy_path, error
+                    )
+                    self.connection.execute("ROLLBACK")
+                    return
+                provenance = legacy.pop("provenance", {})
+                # Legacy entries have no content key, so each is stored under its
+                # tag: readers can still use it, and solves can seed from it
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO ratings VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (
+                            tag,
+                            convergence,
+                            parity,
+                            json.dumps(ratings),
+                            provenance.get(tag, {}).get("warm_start"),
+                        )
+                        for tag, (convergence, parity, ratings) in legacy.items()
+                    ),
+                )
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)",
+                    ((tag, tag) for tag in legacy),
+                )
+                self.connection.execute("INSERT INTO migrations VALUES (?)", (source,))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> Entry | None:
+        if (entry := _entries.get((self.path, key))) is None:
+            row = self.connection.execute(
+                "SELECT convergence, parity, ratings FROM ratings WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            convergence, parity, ratings = row
+            entry = _entries.put(
+                (self.path, key), (convergence, parity, json.loads(ratings))
+            )
+        # Callers get their own ratings to change
+        convergence, parity, ratings = entry
+        return convergence, parity, dict(ratings)
+
+    def __contains__(self, key: str) -> bool:
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM ratings WHERE key = ?", (key,)
+            ).fetchone()
+            is not None
+        )
+
+    def __getitem__(self, key: str) -> Entry:
+        if (entry := self.get(key)) is None:
+            raise KeyError(key)
+        return entry
+
+    def put(self, key: str, entry: Entry, warm_start: str | None = None) -> None:
+        convergence, parity, ratings = entry
+        self.connection.execute(
+            "INSERT OR REPLACE INTO ratings VALUES (?, ?, ?, ?, ?)",
+            (key, convergence, parity, json.dumps(ratings), warm_start),
+        )
+        write_snapshot(self.snapshot_dir, key, ratings)
+        _entries.invalidate(lambda memo_key: memo_key == (self.path, key))
+        _ratings.invalidate(
+            lambda memo_key: memo_key == (os.path.abspath(self.snapshot_dir), key)
+        )
+
+    def warm_start(self, key: str) -> str | None:
+        row = self.connection.execute(
+            "SELECT warm_start FROM ratings WHERE key = ?", (key,)
+        ).fetchone()
+        return row and row[0]
+
+    def tag(
+        self, tag: str, key: str, source: str | None = None, version: str | None = None
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tags (tag, key, source, version) "
+            "VALUES (?, ?, ?, ?)",
+            (tag, key, source, version),
+        )
+
+    def resolve(self, tag: str) -> tuple[str, str | None] | None:
+        return self.connection.execute(
+            "SELECT key, source FROM tags WHERE tag = ?", (tag,)
+        ).fetchone()
+
+    def _current(
+        self,
+        tag: str,
+        source: str | None,
+        version: str | None,
+        convergence: float | None,
+    ) -> str | None:
+        # Each of source, version and convergence that is given must match: the
+        # same games file digest, the same solver version, and a convergence at
+        # least as fine. Migrated entries record neither source nor version, so
+        # they only serve readers that ask for neither
+        resolved = self.connection.execute(
+            "SELECT tags.key, tags.source, tags.version, ratings.convergence "
+            "FROM tags LEFT JOIN ratings ON ratings.key = tags.key "
+            "WHERE tags.tag = ?",
+            (tag,),
+        ).fetchone()
+        if resolved is None:
+            return None
+        key, entry_source, entry_version, entry_convergence = resolved
+        if (
+            (source is not None and entry_source != source)
+            or (version is not None and entry_version != version)
+            or (
+                convergence is not None
+                and (entry_convergence is None or entry_convergence > convergence)
+            )
+        ):
+            return None
+        return key
+
+    def get_tag(
+        self,
+        tag: str,
+        source: str | None = None,
+        version: str | None = None,
+        convergence: float | None = None,
+    ) -> Entry | None:
+        key = self._current(tag, source, version, convergence)
+        return None if key is None else self.get(key)
+
+    def snapshot(
+        self,
+        tag: str,
+        source: str | None = None,
+        version: str | None = None,
+        convergence: float | None = None,
+    ) -> Snapshot | None:
+        if (key := self._current(tag, source, version, convergence)) is None:
+            return None
+        return self._snapshot(key)
+
+    def _snapshot(self, key: str) -> Snapshot | None:
+        if (snapshot := read_snapshot(self.snapshot_dir, key)) is None:
+            # Entries stored before snapshots existed get one on first read
+            if (entry := self.get(key)) is None:
+                return None
+            write_snapshot(self.snapshot_dir, key, entry[2])
+            snapshot = read_snapshot(self.snapshot_dir, key)
+        return snapshot
+
+    def ratings(
+        self,
+        tag: str,
+        source: str | None = None,
+        version: str | None = None,
+        convergence: float | None = None,
+    ) -> dict[str, tuple[float, float]] | None:
+        # Snapshot.ratings() of the tag's entry, kept for repeated reads
+        if (key := self._current(tag, source, version, convergence)) is None:
+            return None
+        memo_key = (os.path.abspath(self.snapshot_dir), key)
+        if (ratings := _ratings.get(memo_key)) is None:
+            if (snapshot := self._snapshot(key)) is None:
+                return None
+            ratings = _ratings.put(memo_key, snapshot.ratings())
+        return dict(ratings)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "RatingsStore":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -0,0 +1,207 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+from collections.abc import Callable
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import TextIO
+
+import instrument
+from backfill import available_years, parse_range
+import conference
+from data import final_week, first_week
+from ratings import CONVERGENCE_DIGITS, get_fbs_ratings, get_fcs_ratings
+
+type Query = tuple[int, int, str]  # (year, week, variant)
+
+QUERY_VARIANTS = ("fbs", "fcs", "conference")
+FORMATS = ("text", "csv", "json")
+RATING_FIELDS = ("year", "week", "variant", "team", "mean", "sigma")
+
+
+def expand_queries(years: list[str], weeks: list[str], variant: str) -> list[Query]:
+    # Years are numbers, ranges like 2020-2024, or all; weeks are the same or
+    # final, the last week each season's file has
+    expanded_years: list[int] = []
+    for text in years:
+        span = parse_range(text)
+        expanded_years.extend(available_years() if span is None else span)
+    queries = []
+    for year in dict.fromkeys(expanded_years):
+        start_week = first_week(f"{year}.csv")
+        last_week = final_week(f"{year}.csv")
+        expanded_weeks: list[int] = []
+        for text in weeks:
+            if text == "final":
+                expanded_weeks.append(last_week)
+            else:
+                span = parse_range(text)
+                expanded_weeks.extend(
+                    week
+                    for week in (
+                        range(start_week, last_week + 1) if span is None else span
+                    )
+                    if start_week <= week <= last_week
+                )
+        queries.extend((year, week, variant) for week in dict.fromkeys(expanded_weeks))
+    return queries
+
+
+def answer(
+    query: Query, solve: bool = True, members: conference.Membership | None = None
+) -> list[dict] | None:
+    # The query's rows, or None if it is not cached and solve is False;
+    # conference queries take the year's membership if it is already built
+    year, week, variant = query
+    read = get_fcs_ratings if variant == "fcs" else get_fbs_ratings
+    if (ratings := read(year, week, solve)) is None:
+        return None
+    if variant == "conference":
+        return conference.conference_rows(year, week, ratings, members)
+    return [
+        {
+            "year": year,
+            "week": week,
+            "variant": variant,
+            "team": team,
+            "mean": mean,
+            "sigma": sigma,
+        }
+        for team, (mean, sigma) in sorted(
+            ratings.items(), key=lambda item: item[1][0], reverse=True
+        )
+    ]
+
+
+def writer(format: str, variant: str, file: TextIO) -> Callable[[list[dict]], None]:
+    # Each query's rows are written and flushed as soon as they are ready
+    if format == "csv":
+        table = csv.DictWriter(
+            file,
+            conference.REPORT_FIELDS if variant == "conference" else RATING_FIELDS,
+            lineterminator="\n",
+        )
+        table.writeheader()
+        file.flush()
+
+    def write(rows: list[dict]) -> None:
+        if format == "csv":
+            table.writerows(rows)
+        elif format == "json":
+            # One object per line, so a reader can act on each as it arrives
+            for row in rows:
+                file.write(json.dumps(row) + "\n")
+        elif rows:
+            file.write(f"{rows[0]['year']} week {rows[0]['week']} {variant}\n")
+            for row in rows:
+                if variant == "conference":
+                    file.write(
+                        f"{row['conference']}"
+                        f"{'*' if row['members'] < 8 else ''}: "
+                        f"{row['mean']:.{conference.CONVERGENCE_DIGITS}f} "
+                        f"± {row['spread']:.{conference.CONVERGENCE_DIGITS}f}\n"
+                    )
+                else:
+                    file.write(
+                        f"{row['team']}: {row['mean']:.{CONVERGENCE_DIGITS}f},  "
+                        f"σ = {row['sigma']:.2f}\n"
+                    )
+            file.write("\n")
+        file.flush()
+
+    return write
+
+
+def run(
+    queries: list[Query],
+    write: Callable[[list[dict]], None],
+    workers: int | None = None,
+) -> list[Query]:
+    # Cached queries are read on threads and written in order; the rest are
+    # solved, on worker processes if asked, and written as each finishes.
+    # Returns the queries that failed
+    failed: list[Query] = []
+    # Conference membership is indexed once for every year asked about
+    index = conference.membership_index(
+        {year for year, _, variant in queries if variant == "conference"}
+    )
+
+    def report(query: Query, error: Exception) -> None:
+        failed.append(query)
+        year, week, variant = query
+        print(f"{year} week {week} {variant} failed: {error!r}", file=sys.stderr)
+
+    def cached(query: Query) -> tuple[list[dict] | None, Exception | None]:
+        # Each read opens its own store; sqlite connections are not shared
+        try:
+            return answer(query, False, index.get(query[0])), None
+        except Exception as error:
+            return None, error
+
+    missing: list[Query] = []
+    with ThreadPoolExecutor(workers) as pool:
+        for query, (rows, error) in zip(queries, pool.map(cached, queries)):
+            if error is not None:
+                report(query, error)
+            elif rows is None:
+                missing.append(query)
+            else:
+                write(rows)
+    if workers is None or workers <= 1:
+        for query in missing:
+            try:
+                write(answer(query, members=index.get(query[0])))
+            except Exception as error:
+                report(query, error)
+        return failed
+    with ProcessPoolExecutor(workers) as pool:
+        pending: dict[Future, Query] = {
+            pool.submit(answer, query, True, index.get(query[0])): query
+            for query in missing
+        }
+        for future in as_completed(pending):
+            try:
+                write(future.result())
+            except Exception as error:
+                report(pending[future], error)
+    return failed
+
+
+def main(argv: list[str], variant: str = "fbs") -> int:
+    parser = argparse.ArgumentParser(
+        description="Print cached or freshly solved ratings for many weeks at once"
+    )
+    parser.add_argument(
+        "--year",
+        nargs="+",
+        required=True,
+        help="years: 2024, a range like 2020-2024, or all",
+    )
+    parser.add_argument(
+        "--week",
+        nargs="+",
+        default=["final"],
+        help="weeks: 12, a range like 1-12, all, or final (default)",
+    )
+    parser.add_argument("--variant", choices=QUERY_VARIANTS, default=variant)
+    parser.add_argument("--format", choices=FORMATS, default="text")
+    parser.add_argument("--workers", type=int, help="processes for solving")
+    parser.add_argument(
+        "--verbose", action="store_true", help="log solver progress to stderr"
+    )
+    args = parser.parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        instrument.sink = instrument.logging_sink()
+    try:
+        queries = expand_queries(args.year, args.week, args.variant)
+    except FileNotFoundError as error:
+        parser.error(f"no season file {error.filename}")
+    failed = run(queries, writer(args.format, args.variant, sys.stdout), args.workers)
+    return 1 if failed else 0
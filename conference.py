@@ -1,3 +1,6 @@
+import math
+import sys
+from collections.abc import Iterable
 from statistics import mean
 
 from ratings import int_input, get_fbs_ratings
@@ -220,26 +223,76 @@ CONFERENCES = {  # dict[conference, dict[team, (year_joined, year_left)]]
     },
 }
 
+type Membership = dict[str, list[str]]  # conference -> teams
+REPORT_FIELDS = ("year", "week", "conference", "members", "rated", "mean", "spread")
+
+
+def membership_index(years: Iterable[int]) -> dict[int, Membership]:
+    # Membership past LAST_UPDATED is assumed unchanged since then
+    index = {year: {conference: [] for conference in CONFERENCES} for year in years}
+    for conference, teams in CONFERENCES.items():
+        for team, span in teams.items():
+            for year, members in index.items():
+                if min(year, LAST_UPDATED - 1) in span:
+                    members[conference].append(team)
+    return index
+
+
+def conference_strength(
+    team_ratings: dict[str, tuple[float, float]], members: Membership
+) -> dict[str, tuple[float, float, int]]:
+    # (mean, spread, rated teams), where the spread is the standard deviation of
+    # the conference mean with each team's sigma taken as independent
+    strength = {}
+    for conference, teams in members.items():
+        rated = [team_ratings[team] for team in teams if team in team_ratings]
+        if rated:
+            strength[conference] = (
+                mean(mu for mu, _ in rated),
+                math.sqrt(sum(sigma**2 for _, sigma in rated)) / len(rated),
+                len(rated),
+            )
+    return strength
+
+
+def conference_rows(
+    year: int,
+    week: int,
+    team_ratings: dict[str, tuple[float, float]],
+    members: Membership | None = None,
+) -> list[dict]:
+    # Strongest conference first
+    if members is None:
+        members = membership_index([year])[year]
+    strength = conference_strength(team_ratings, members)
+    return [
+        {
+            "year": year,
+            "week": week,
+            "conference": conference,
+            "members": len(members[conference]),
+            "rated": strength[conference][2],
+            "mean": strength[conference][0],
+            "spread": strength[conference][1],
+        }
+        for conference in sorted(strength, key=lambda c: strength[c][0], reverse=True)
+    ]
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from cli import main
+
+        sys.exit(main(sys.argv[1:], "conference"))
     year = int_input("Year: ", 2024)
     week = int_input("Week: ", 21)  # 2024 had 21 weeks, 2023 had 17 weeks
     team_ratings = get_fbs_ratings(year, week)
-    year = min(year, LAST_UPDATED - 1)
-    current_conference_members = {
-        conference: [
-            team
-            for team in CONFERENCES[conference]
-            if year in CONFERENCES[conference][team]
-        ]
-        for conference in CONFERENCES
-    }
+    current_conference_members = membership_index([year])[year]
     average_ratings = {
-        conference: mean(
-            team_ratings[team][0]
-            for team in current_conference_members[conference]
-            if team in team_ratings
-        )
-        for conference in current_conference_members if len(current_conference_members[conference])
+        conference: average
+        for conference, (average, _, _) in conference_strength(
+            team_ratings, current_conference_members
+        ).items()
     }
     unofficial = False
     for conference in sorted(average_ratings, key=average_ratings.get, reverse=True):
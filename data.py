@@ -1,8 +1,14 @@
-from collections.abc import Callable
+import os
+import weakref
+from collections.abc import Callable, Hashable, Iterable, Iterator, Sequence
 from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, overload
 
 import csv
 
+import numpy as np
+
+from memo import LRU
 
 TEAM_NAME_LENGTH = 40
 TEAM_ID_LENGTH = 10
@@ -10,65 +16,413 @@ type Row = tuple[int, bool, datetime, str, str, str, str, str, str]
 type Key = Callable[[int, bool, datetime, str, str, str, str, str, str], Row]
 
 
-def csv2list(key: Key) -> Callable[[str], list[tuple[str, str]]]:
-    def f(csvfile: str) -> list[tuple[str, str]]:
-        results = []
-        with open(csvfile, "r") as file:
-            reader = csv.reader(file)
-            next(reader)
-            for (
-                week,
-                before_playoff,
-                time,
-                game_completed,
-                home_id,
-                home_team,
-                home_division,
-                home_conference,
-                home_points,
-                away_id,
-                away_team,
-                away_division,
-                away_conference,
-                away_points,
-            ) in reader:
-                if game_completed.lower() == "true":
-                    home = str(home_id)
-                    home = (
-                        home_team[:TEAM_NAME_LENGTH]
-                        + " " * (TEAM_NAME_LENGTH - len(home_team))
-                        + home[:TEAM_ID_LENGTH]
-                        + " " * (TEAM_ID_LENGTH - len(home))
-                    )
-                    away = str(away_id)
-                    away = (
-                        away_team[:TEAM_NAME_LENGTH]
-                        + " " * (TEAM_NAME_LENGTH - len(away_team))
-                        + away[:TEAM_ID_LENGTH]
-                        + " " * (TEAM_ID_LENGTH - len(away))
-                    )
-                    _, _, _, home, _, _, away, _, _ = key(
-                        int(week),
-                        before_playoff == "regular",
-                        datetime.fromisoformat(time),
-                        home,
-                        home_conference,
-                        home_division,
-                        away,
-                        away_conference,
-                        away_division,
-                    )
-                    if home:
-                        if int(home_points) > int(away_points):
-                            results.append((home, away))
-                        else:
-                            results.append((away, home))
-        return results
+class Season(Sequence[tuple[str, str]]):
+    def __init__(self, teams: list[str], winners: np.ndarray, losers: np.ndarray):
+        self.teams = teams
+        self.index = {team: i for i, team in enumerate(teams)}
+        self.winners = np.asarray(winners, dtype=np.int32)
+        self.losers = np.asarray(losers, dtype=np.int32)
+
+    @classmethod
+    def from_games(cls, games: Iterable[tuple[str, str]]) -> "Season":
+        index: dict[str, int] = {}
+        winners, losers = [], []
+        for winner, loser in games:
+            winners.append(index.setdefault(winner, len(index)))
+            losers.append(index.setdefault(loser, len(index)))
+        return cls(list(index), np.array(winners), np.array(losers))
+
+    def __len__(self) -> int:
+        return len(self.winners)
+
+    @overload
+    def __getitem__(self, i: int) -> tuple[str, str]: ...
+    @overload
+    def __getitem__(self, i: slice) -> "Season": ...
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Season(self.teams, self.winners[i], self.losers[i])
+        return self.teams[self.winners[i]], self.teams[self.losers[i]]
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        teams = self.teams
+        for w, l in zip(self.winners.tolist(), self.losers.tolist()):
+            yield teams[w], teams[l]
+
+
+def team_keys(teams: list[str], ids: list[str]) -> np.ndarray:
+    # Keys cut names and ids to fixed widths, so two teams that only differ
+    # past the cut (long names in files without an id column) would be rated
+    # as one
+    seen: dict[str, tuple[str, str]] = {}
+    for team, team_id in set(zip(teams, ids)):
+        key = team_key(team, team_id)
+        if (other := seen.setdefault(key, (team, team_id))) != (team, team_id):
+            raise ValueError(
+                f"Teams {other[0]!r} and {team!r} share the key {key.strip()!r};"
+                " map an id column to tell them apart"
+            )
+    return np.array([team_key(team, team_id) for team, team_id in zip(teams, ids)])
+
+
+def team_key(team: str, team_id: str) -> str:
+    return (
+        team[:TEAM_NAME_LENGTH]
+        + " " * (TEAM_NAME_LENGTH - len(team))
+        + team_id[:TEAM_ID_LENGTH]
+        + " " * (TEAM_ID_LENGTH - len(team_id))
+    )
+
+
+def previous_monday(dt: datetime) -> datetime:
+    dt = dt - timedelta(hours=5)
+    dt = dt - timedelta(days=dt.weekday())
+    return dt.replace(hour=5, minute=0, second=0, microsecond=0)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class SeasonTable(NamedTuple):
+    week: np.ndarray
+    before_playoff: np.ndarray
+    start_times: list[datetime]
+    start: np.ndarray  # microseconds since the Unix epoch
+    completed: np.ndarray
+    home: np.ndarray
+    home_conference: np.ndarray
+    home_division: np.ndarray
+    home_points: np.ndarray
+    away: np.ndarray
+    away_conference: np.ndarray
+    away_division: np.ndarray
+    away_points: np.ndarray
+    reg_season_end_week: int
+    reg_season_end_date: datetime
+
+    def columns(self) -> "Columns":
+        return Columns(
+            self.week,
+            self.before_playoff,
+            self.start,
+            self.home,
+            self.home_conference,
+            self.home_division,
+            self.away,
+            self.away_conference,
+            self.away_division,
+            self.completed,
+        )
+
+
+# Filter columns mirror Row, plus the mask of games still selected
+class Columns(NamedTuple):
+    week: np.ndarray
+    before_playoff: np.ndarray
+    start: np.ndarray
+    home: np.ndarray
+    home_conference: np.ndarray
+    home_division: np.ndarray
+    away: np.ndarray
+    away_conference: np.ndarray
+    away_division: np.ndarray
+    keep: np.ndarray
+
+
+type Column = str | int  # a header name, or a position counting from 0
+
+
+class Schema(NamedTuple):
+    # Where each column of a season file is found. Without points columns,
+    # each game lists the winner as home and the loser as away; other columns
+    # left out get neutral values (every game a completed regular season game,
+    # weeks counted from the first game's date)
+    home: Column
+    away: Column
+    start: Column
+    home_points: Column | None = None
+    away_points: Column | None = None
+    home_id: Column | None = None
+    away_id: Column | None = None
+    week: Column | None = None
+    season_type: Column | None = None
+    completed: Column | None = None
+    home_division: Column | None = None
+    away_division: Column | None = None
+    home_conference: Column | None = None
+    away_conference: Column | None = None
+
+    def fields(self) -> tuple[Column | None, ...]:
+        # In the column order of a collegefootballdata.com export
+        return (
+            self.week,
+            self.season_type,
+            self.start,
+            self.completed,
+            self.home_id,
+            self.home,
+            self.home_division,
+            self.home_conference,
+            self.home_points,
+            self.away_id,
+            self.away,
+            self.away_division,
+            self.away_conference,
+            self.away_points,
+        )
+
+
+# collegefootballdata.com has renamed its headers between seasons, but not
+# reordered them
+COLLEGE_FOOTBALL_DATA = Schema(
+    home=5,
+    away=10,
+    start=2,
+    home_points=8,
+    away_points=13,
+    home_id=4,
+    away_id=9,
+    week=0,
+    season_type=1,
+    completed=3,
+    home_division=6,
+    away_division=11,
+    home_conference=7,
+    away_conference=12,
+)
+# What a missing column reads as, by position in Schema.fields(); the points
+# stand in for a winner and loser column pair
+_SCHEMA_DEFAULTS = ("", "regular", "", "true", "", "", "", "", "1", "", "", "", "", "0")
+
+_tables = LRU("tables", 8, 1024 * 2**20)
+
+
+def read_rows(csvfile: str, schema: Schema = COLLEGE_FOOTBALL_DATA) -> list[list[str]]:
+    # Rows come back in the column order of a collegefootballdata.com export,
+    # whatever the order in the file
+    with open(csvfile, "r") as file:
+        reader = csv.reader(file)
+        header = [name.lstrip("\ufeff") for name in next(reader)]
+        if missing := [
+            name
+            for name in schema.fields()
+            if isinstance(name, str) and name not in header
+        ]:
+            raise ValueError(f"{csvfile} has no column named {missing[0]!r}")
+        columns = [
+            header.index(name) if isinstance(name, str) else name
+            for name in schema.fields()
+        ]
+        if columns == list(range(len(columns))):
+            # Any columns past the schema's are dropped here too
+            return [row[: len(columns)] for row in reader]
+        return [
+            [
+                default if column is None else row[column]
+                for column, default in zip(columns, _SCHEMA_DEFAULTS)
+            ]
+            for row in reader
+        ]
+
+
+def load_table(
+    csvfile: str | SeasonTable, schema: Schema = COLLEGE_FOOTBALL_DATA
+) -> SeasonTable:
+    if isinstance(csvfile, SeasonTable):
+        return csvfile
+    path = os.path.abspath(csvfile)
+    mtime = os.stat(path).st_mtime_ns
+    if (table := _tables.get((path, mtime, schema))) is None:
+        # A changed file leaves its old table to age out
+        table = _tables.put(
+            (path, mtime, schema), table_from_rows(read_rows(path, schema))
+        )
+    return table
+
+
+def table_from_rows(rows: list[list[str]]) -> SeasonTable:
+    (
+        week,
+        season_type,
+        time,
+        game_completed,
+        home_id,
+        home_team,
+        home_division,
+        home_conference,
+        home_points,
+        away_id,
+        away_team,
+        away_division,
+        away_conference,
+        away_points,
+    ) = [list(column) for column in zip(*rows)] or [[]] * 14
+    start_times = [datetime.fromisoformat(t) for t in time]
+    # Dates without a time zone are taken as UTC
+    start_times = [
+        t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in start_times
+    ]
+    start = np.array(
+        [(t - _EPOCH) // _MICROSECOND for t in start_times], dtype=np.int64
+    )
+    unnumbered = np.array(week) == ""
+    if unnumbered.any():
+        week = [w or "0" for w in week]
+        first = (previous_monday(min(start_times)) - _EPOCH) // _MICROSECOND
+        week = np.where(
+            unnumbered,
+            (start - first) // (timedelta(weeks=1) // _MICROSECOND) + 1,
+            np.array(week, dtype=np.int64),
+        )
+    postseason = [t == "postseason" for t in season_type]
+    keys = team_keys(home_team + away_team, home_id + away_id)
+    return SeasonTable(
+        np.array(week, dtype=np.int64),
+        np.array(season_type) == "regular",
+        start_times,
+        start,
+        np.char.lower(game_completed) == "true",
+        keys[: len(home_team)],
+        np.array(home_conference),
+        np.array(home_division),
+        np.array([int(p) if p else 0 for p in home_points], dtype=np.int64),
+        keys[len(home_team) :],
+        np.array(away_conference),
+        np.array(away_division),
+        np.array([int(p) if p else 0 for p in away_points], dtype=np.int64),
+        max((int(w) for w, p in zip(week, postseason) if not p), default=0),
+        previous_monday(
+            min(
+                (t for t, p in zip(start_times, postseason) if p),
+                default=datetime.max.replace(tzinfo=timezone.utc),
+            )
+        ),
+    )
+
+
+type ColumnFilter = Callable[[Columns], Columns]
+# Vectorized twin of each filter key, the key it wraps (None if terminal), and
+# a hashable description of what the filter does, so that separately built
+# chains of the same filters share memoized games
+_column_filters: weakref.WeakKeyDictionary[
+    Callable, tuple[ColumnFilter, Key | None, Hashable]
+] = weakref.WeakKeyDictionary()
+_games = LRU("games", 64, 256 * 2**20)
+
+
+def columnar(
+    column_filter: ColumnFilter = lambda columns: columns,
+) -> Callable[[Key], Key]:
+    def decorator(key: Key) -> Key:
+        _column_filters[key] = (column_filter, None, column_filter)
+        return key
+
+    return decorator
+
+
+def csv2list(key: Key) -> Callable[..., list[tuple[str, str]] | Season]:
+    column_filters: list[ColumnFilter] = []
+    chain: list[Hashable] = []
+    terminal: Key | None = key
+    while terminal is not None and terminal in _column_filters:
+        column_filter, terminal, signature = _column_filters[terminal]
+        column_filters.append(column_filter)
+        chain.append(signature)
+
+    # Takes a season file, or a table already built from one
+    def f(
+        csvfile: str | SeasonTable,
+        indexed: bool = False,
+        schema: Schema = COLLEGE_FOOTBALL_DATA,
+    ) -> list[tuple[str, str]] | Season:
+        if isinstance(csvfile, SeasonTable) or terminal is not None:
+            return select(load_table(csvfile, schema), indexed)
+        path = os.path.abspath(csvfile)
+        memo_key = (path, os.stat(path).st_mtime_ns, schema, tuple(chain), indexed)
+        if (games := _games.get(memo_key)) is None:
+            games = _games.put(memo_key, select(load_table(path, schema), indexed))
+        # Callers may change their list, but not the memoized one
+        return games if indexed else list(games)
+
+    def select(table: SeasonTable, indexed: bool) -> list[tuple[str, str]] | Season:
+        columns = table.columns()
+        for column_filter in column_filters:
+            columns = column_filter(columns)
+        rows = np.flatnonzero(columns.keep)
+        home, away = columns.home[rows].tolist(), columns.away[rows].tolist()
+        if terminal is not None:
+            # Keys without a vectorized twin still see every remaining row
+            for i, row in enumerate(rows.tolist()):
+                _, _, _, home[i], _, _, away[i], _, _ = terminal(
+                    columns.week[row].item(),
+                    bool(columns.before_playoff[row]),
+                    table.start_times[row],
+                    home[i],
+                    str(columns.home_conference[row]),
+                    str(columns.home_division[row]),
+                    away[i],
+                    str(columns.away_conference[row]),
+                    str(columns.away_division[row]),
+                )
+        # Ratings have no draws, so drawn games are left out rather than
+        # given to either side; these include 0-0 games that were cancelled
+        # but still marked completed
+        margin = (table.home_points[rows] - table.away_points[rows]).tolist()
+        results = [
+            (h, a) if m > 0 else (a, h)
+            for h, a, m in zip(home, away, margin)
+            if h and m != 0
+        ]
+        return Season.from_games(results) if indexed else results
 
     return f
 
 
+def _map_groups(func: Callable[[np.ndarray], np.ndarray], groups: np.ndarray):
+    # String ufuncs are slow per element, but a season has few distinct groups
+    unique, inverse = np.unique(groups, return_inverse=True)
+    return func(unique)[inverse]
+
+
+def _squash(groups: np.ndarray) -> np.ndarray:
+    return np.char.add(
+        np.char.ljust(np.char.upper(groups), TEAM_NAME_LENGTH), "0         "
+    )
+
+
+def _group_columns(
+    group_name: str,
+    include_others: bool,
+    squash_others: bool,
+    home_group: np.ndarray,
+    away_group: np.ndarray,
+    home: np.ndarray,
+    away: np.ndarray,
+    home_label: np.ndarray,
+    away_label: np.ndarray,
+    keep: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    home_other = home_group != group_name
+    away_other = ~home_other & (away_group != group_name)
+    if include_others:
+        keep = keep & ~(home_other & (away_group != group_name))
+        if squash_others:
+            home = np.where(home_other, _map_groups(_squash, home_group), home)
+            away = np.where(away_other, _map_groups(_squash, away_group), away)
+    else:
+        keep = keep & ~home_other & ~away_other
+    home_label = np.where(
+        home_other, _map_groups(np.char.upper, home_group), home_label
+    )
+    away_label = np.where(
+        away_other, _map_groups(np.char.upper, away_group), away_label
+    )
+    return home, away, home_label, away_label, keep
+
+
 @csv2list
+@columnar()
 def all_games(*args):
     return args
 
@@ -91,7 +445,7 @@ def add_division_filter(
             if home_division != division_name:
                 if away_division != division_name or not include_others:
                     home = ""
-                elif squash_others:
+                elif squash_others and home:
                     home = (
                         home_division.upper()
                         + " " * (TEAM_NAME_LENGTH - len(home_division))
@@ -120,6 +474,32 @@ def add_division_filter(
                 away_division,
             )
 
+        def column_filter(columns: Columns) -> Columns:
+            home, away, home_conference, away_conference, keep = _group_columns(
+                division_name,
+                include_others,
+                squash_others,
+                columns.home_division,
+                columns.away_division,
+                columns.home,
+                columns.away,
+                columns.home_conference,
+                columns.away_conference,
+                columns.keep,
+            )
+            return columns._replace(
+                home=home,
+                away=away,
+                home_conference=home_conference,
+                away_conference=away_conference,
+                keep=keep,
+            )
+
+        _column_filters[final_function] = (
+            column_filter,
+            key,
+            ("division", division_name, include_others, squash_others),
+        )
         return final_function
 
     return decorator
@@ -143,7 +523,7 @@ def add_conference_filter(
             if home_conference != conference_name:
                 if away_conference != conference_name or not include_others:
                     home = ""
-                elif squash_others:
+                elif squash_others and home:
                     home = (
                         home_conference.upper()
                         + " " * (TEAM_NAME_LENGTH - len(home_conference))
@@ -172,35 +552,45 @@ def add_conference_filter(
                 away_division,
             )
 
+        def column_filter(columns: Columns) -> Columns:
+            home, away, home_division, away_division, keep = _group_columns(
+                conference_name,
+                include_others,
+                squash_others,
+                columns.home_conference,
+                columns.away_conference,
+                columns.home,
+                columns.away,
+                columns.home_division,
+                columns.away_division,
+                columns.keep,
+            )
+            return columns._replace(
+                home=home,
+                away=away,
+                home_division=home_division,
+                away_division=away_division,
+                keep=keep,
+            )
+
+        _column_filters[final_function] = (
+            column_filter,
+            key,
+            ("conference", conference_name, include_others, squash_others),
+        )
         return final_function
 
     return decorator
 
 
-def previous_monday(dt: datetime) -> datetime:
-    dt = dt - timedelta(hours=5)
-    dt = dt - timedelta(days=dt.weekday())
-    return dt.replace(hour=5, minute=0, second=0, microsecond=0)
-
-
 def add_week_filter(
-    last_week: int, csv_file: str | None = None
+    last_week: int, csv_file: str | SeasonTable | None = None
 ) -> Callable[[Key], Key]:
     include_postseason = False
     if csv_file is not None:
-        with open(csv_file, "r") as file:
-            reader = csv.reader(file)
-            next(reader)
-            reg_season_end_week = 0
-            reg_season_end_date = datetime.max.replace(tzinfo=timezone.utc)
-            for row in reader:
-                if row[1] == "postseason":
-                    reg_season_end_date = min(
-                        datetime.fromisoformat(row[2]), reg_season_end_date
-                    )
-                else:
-                    reg_season_end_week = max(int(row[0]), reg_season_end_week)
-            reg_season_end_date = previous_monday(reg_season_end_date)
+        table = load_table(csv_file)
+        reg_season_end_week = table.reg_season_end_week
+        reg_season_end_date = table.reg_season_end_date
         if last_week > reg_season_end_week:
             include_postseason = True
 
@@ -224,13 +614,59 @@ def add_week_filter(
                 home = ""
             return key(week, before_playoffs, start_time, home, _4, _5, _6, _7, _8)
 
+        def column_filter(columns: Columns) -> Columns:
+            week = columns.week
+            if csv_file is not None:
+                week = np.where(
+                    columns.before_playoff,
+                    week,
+                    (columns.start - (reg_season_end_date - _EPOCH) // _MICROSECOND)
+                    / (timedelta(weeks=1) // _MICROSECOND)
+                    + reg_season_end_week,
+                )
+            return columns._replace(week=week, keep=columns.keep & ~(week > last_week))
+
+        _column_filters[final_function] = (
+            column_filter,
+            key,
+            (
+                ("week", last_week)
+                if csv_file is None
+                else ("week", last_week, reg_season_end_week, reg_season_end_date)
+            ),
+        )
         return final_function
 
     return decorator
 
 
+def schedule_weeks(table: SeasonTable) -> np.ndarray:
+    # The first week whose filter keeps each game, counting postseason games
+    # the same way add_week_filter does
+    postseason_week = np.ceil(
+        (table.start - (table.reg_season_end_date - _EPOCH) // _MICROSECOND)
+        / (timedelta(weeks=1) // _MICROSECOND)
+        + table.reg_season_end_week
+    )
+    return np.where(table.before_playoff, table.week, postseason_week).astype(np.int64)
+
+
+def first_week(csv_file: str) -> int:
+    weeks = schedule_weeks(load_table(csv_file))
+    return int(weeks.min()) if len(weeks) else 0
+
+
+def final_week(csv_file: str) -> int:
+    return int(schedule_weeks(load_table(csv_file)).max(initial=0))
+
+
 @csv2list
 @add_division_filter("fbs")
+@columnar(
+    lambda columns: columns._replace(
+        keep=columns.keep & (columns.home_conference != columns.away_conference)
+    )
+)
 def fbs_nonconference(
     _0: int,
     _1: bool,
@@ -249,17 +685,20 @@ def fbs_nonconference(
 
 @csv2list
 @add_division_filter("fbs")
+@columnar()
 def fbs(*args):
     return args
 
 
 @csv2list
 @add_division_filter("fbs", include_others=False)
+@columnar()
 def fbs_pure(*args):
     return args
 
 
 @csv2list
 @add_conference_filter("Big Ten")
+@columnar()
 def big_ten(*args):
     return args
@@ -0,0 +1,85 @@
+import contextlib
+import json
+import logging
+import time
+from collections.abc import Callable, Iterator
+from typing import Any, TextIO
+
+type Sink = Callable[[str, dict[str, Any]], None]
+
+# None means no instrumentation: emit returns at once and phases are not timed
+sink: Sink | None = None
+
+
+def emit(event: str, **fields: Any) -> None:
+    if sink is not None:
+        sink(event, fields)
+
+
+@contextlib.contextmanager
+def phase(name: str, **fields: Any) -> Iterator[None]:
+    if sink is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit("phase", name=name, seconds=time.perf_counter() - start, **fields)
+
+
+@contextlib.contextmanager
+def use(new_sink: Sink | None) -> Iterator[None]:
+    global sink
+    previous, sink = sink, new_sink
+    try:
+        yield
+    finally:
+        sink = previous
+
+
+def logging_sink(
+    logger: logging.Logger = logging.getLogger("brr"), level: int = logging.INFO
+) -> Sink:
+    def log(event: str, fields: dict[str, Any]) -> None:
+        if logger.isEnabledFor(level):
+            logger.log(
+                level,
+                "%s %s",
+                event,
+                " ".join(
+                    f"{k}={v:.6g}" if isinstance(v, float) else f"{k}={v}"
+                    for k, v in fields.items()
+                ),
+            )
+
+    return log
+
+
+class JsonLinesSink:
+    # One JSON object per line, flushed as it is written so a running job can
+    # be tailed
+    def __init__(self, path: str | TextIO):
+        if isinstance(path, str):
+            self.file = open(path, "a")
+            self.owned = True
+        else:
+            self.file = path
+            self.owned = False
+
+    def __call__(self, event: str, fields: dict[str, Any]) -> None:
+        self.file.write(
+            json.dumps({"event": event, "time": time.time()} | fields, default=float)
+            + "\n"
+        )
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.owned:
+            self.file.close()
+
+    def __enter__(self) -> "JsonLinesSink":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -0,0 +1,109 @@
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+import numpy as np
+
+# Every cache by name, for reporting and clearing them all at once
+caches: dict[str, "LRU"] = {}
+
+
+def nbytes(value: Any) -> int:
+    # A rough deep size: arrays by their buffers, containers by their items
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            nbytes(k) + nbytes(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(nbytes(item) for item in value)
+    if hasattr(value, "__dict__"):
+        return nbytes(vars(value))
+    return sys.getsizeof(value)
+
+
+class LRU:
+    # The least recently used entries are dropped once there are more than
+    # max_entries or they take more than max_bytes; a value too big to fit on
+    # its own is handed back without being kept
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_bytes: int | None = None,
+        sizeof: Callable[[Any], int] = nbytes,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self.lock:
+            self._drop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return value
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self.entries)))
+        return value
+
+    def _drop(self, key: Hashable) -> None:
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+
+    def invalidate(self, match: Callable[[Hashable], bool] | None = None) -> int:
+        # Drops every entry whose key matches, or all of them; returns how many
+        with self.lock:
+            keys = [key for key in self.entries if match is None or match(key)]
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+
+def stats() -> dict[str, dict[str, int]]:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def invalidate() -> None:
+    for cache in caches.values():
+        cache.clear()
@@ -0,0 +1,111 @@
+import json
+import os
+import uuid
+from collections.abc import Iterable
+
+import numpy as np
+
+from brr_math import win_probability_matrix
+from cache import RatingsStore, file_digest
+from data import TEAM_NAME_LENGTH, load_table, schedule_weeks
+from ratings import CONVERGENCE_DIGITS, solve_variant, solver_version
+
+PREDICTION_DIR = "PredictionCache"
+
+
+class Predictor:
+    # Entry [i, j] of the matrix is the chance that teams[i] beats teams[j]
+    def __init__(self, teams: list[str], parity: float, matrix: np.ndarray):
+        self.teams = teams
+        self.parity = parity
+        self.matrix = matrix
+        self.index = {
+            team[:TEAM_NAME_LENGTH].strip(): i for i, team in enumerate(teams)
+        }
+        self.index |= {team: i for i, team in enumerate(teams)}
+
+    @classmethod
+    def build(
+        cls,
+        ratings: dict[str, tuple[float, float]],
+        parity: float,
+        path: str | None = None,
+    ) -> "Predictor":
+        teams = list(ratings)
+        mean, sigma = np.array([ratings[team] for team in teams], dtype=np.float64).T
+        probabilities = win_probability_matrix(mean, sigma, parity)
+        if path is None:
+            return cls(teams, parity, probabilities.astype(np.float32))
+        # Written under temporary names unique to this writer and renamed, so
+        # readers never map a half-written matrix and concurrent builds of the
+        # same key don't collide
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        matrix = np.lib.format.open_memmap(
+            temporary + ".npy", "w+", np.float32, probabilities.shape
+        )
+        matrix[:] = probabilities
+        matrix.flush()
+        del matrix
+        with open(temporary + ".json", "w") as file:
+            json.dump({"teams": teams, "parity": parity}, file)
+        os.replace(temporary + ".npy", path + ".npy")
+        os.replace(temporary + ".json", path + ".json")
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path: str) -> "Predictor":
+        with open(path + ".json", "r") as file:
+            header = json.load(file)
+        return cls(
+            header["teams"], header["parity"], np.load(path + ".npy", mmap_mode="r")
+        )
+
+    @classmethod
+    def load(
+        cls,
+        year: int,
+        week: int,
+        variant: str = "fbs",
+        directory: str = PREDICTION_DIR,
+    ) -> "Predictor":
+        games_file = f"{year}.csv"
+        tag = f"{year}w{week:02}{variant}"
+        source = file_digest(games_file) if os.path.exists(games_file) else None
+        convergence = 10.0**-CONVERGENCE_DIGITS
+        with RatingsStore() as cache:
+            fresh = (
+                cache.get_tag(tag, source, solver_version(), convergence) is not None
+            )
+        if not fresh:
+            solve_variant(year, week, variant, convergence)
+        with RatingsStore() as cache:
+            key, _ = cache.resolve(tag)
+            # Matrices are named by content key, so a re-solved tag gets a new one
+            path = os.path.join(directory, key)
+            if os.path.exists(path + ".npy") and os.path.exists(path + ".json"):
+                return cls.open(path)
+            _, parity, ratings = cache[key]
+        os.makedirs(directory, exist_ok=True)
+        return cls.build(ratings, parity, path)
+
+    def rows(self, teams: Iterable[str]) -> np.ndarray:
+        return np.array([self.index.get(team, -1) for team in teams], dtype=np.intp)
+
+    def probability(self, team: str, opponent: str) -> float:
+        return float(self.matrix[self.index[team], self.index[opponent]])
+
+    def matchups(self, teams: Iterable[str], opponents: Iterable[str]) -> np.ndarray:
+        # Unrated teams (lower divisions) come back as NaN
+        rows, columns = self.rows(teams), self.rows(opponents)
+        known = (rows >= 0) & (columns >= 0)
+        probabilities = np.full(len(rows), np.nan, dtype=np.float32)
+        probabilities[known] = self.matrix[rows[known], columns[known]]
+        return probabilities
+
+    def slate(self, csvfile: str, week: int) -> list[tuple[str, str, float]]:
+        # Every game the season file lists for the week, played or not, as
+        # (home, away, chance the home team wins)
+        table = load_table(csvfile)
+        games = np.flatnonzero(schedule_weeks(table) == week)
+        home, away = table.home[games].tolist(), table.away[games].tolist()
+        return list(zip(home, away, self.matchups(home, away).tolist()))
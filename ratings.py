@@ -1,9 +1,23 @@
-import json
+import logging
+import os
+import sys
 from collections.abc import Callable
 from typing import TypeVar
 
-from brr_math import iter_ratings, calc_parity
-from data import csv2list, add_division_filter, add_week_filter, TEAM_NAME_LENGTH
+import instrument
+from brr_math import GRID_VERSION, SOLVER_VERSION, iter_ratings, calc_parity
+from cache import RatingsStore, content_key, file_digest
+from data import (
+    csv2list,
+    add_division_filter,
+    add_week_filter,
+    all_games,
+    columnar,
+    COLLEGE_FOOTBALL_DATA,
+    Schema,
+    SeasonTable,
+    TEAM_NAME_LENGTH,
+)
 
 CONVERGENCE_DIGITS = 6
 _CONVERGENCE = 10.0**-CONVERGENCE_DIGITS
@@ -27,6 +41,14 @@ def variadic_call(func: T) -> T:
     return wrapper
 
 
+def solver_version(engine: str = "quad") -> str:
+    # The engines agree only to within their integration error, so other
+    # engines key and tag their own entries
+    if engine == "grid":
+        return f"{SOLVER_VERSION}-grid{GRID_VERSION}"
+    return SOLVER_VERSION if engine == "quad" else f"{SOLVER_VERSION}-{engine}"
+
+
 def cache_ratings(games_func: Callable[[str], list[tuple[str, str]]]):
     def final_function(
         games_file: str,
@@ -35,78 +57,192 @@ def cache_ratings(games_func: Callable[[str], list[tuple[str, str]]]):
         parity: float | None = None,
         ratings: dict[str, tuple[float, float]] = None,
         teams: list[str] | None = None,
+        workers: int | None = None,
+        warm_start: list[str] | None = None,
+        engine: str = "quad",
+        solver: str | None = None,
     ) -> tuple[float, float, dict[str, tuple[float, float]]]:
-        with open("RatingsCache.json", "r+") as cache_file:
-            cache: dict[str, tuple[float, float, dict[str, tuple[float, float]]]] = (
-                json.load(cache_file)
+        with RatingsStore() as cache:
+            with instrument.phase("load", tag=cache_key):
+                games = games_func(games_file)
+            # The solver only changes the path to the fixed point and is left
+            # out of the key
+            key = content_key(
+                games, convergence, parity, ratings, teams, solver_version(engine)
             )
-            games = games_func(games_file)
-            if parity is None:
-                if ratings:
-                    parity = calc_parity(games, ratings)
-                elif cache_key in cache and cache[cache_key][0] > convergence:
-                    parity, ratings = cache[cache_key][1:]
-            if cache_key not in cache or parity is not None:
-                cache[cache_key] = variadic_call(iter_ratings)(
+            cached = cache.get(key)
+            instrument.emit("cache", tag=cache_key, hit=cached is not None)
+            if cached is None:
+                # The tag's previous entry (older games or a coarser convergence)
+                # is the closest seed, then any earlier week asked for
+                seed = next(
+                    (
+                        tag
+                        for tag in [cache_key, *(warm_start or ())]
+                        if cache.resolve(tag) is not None
+                    ),
+                    None,
+                )
+                if parity is None:
+                    if seed is not None:
+                        parity, seed_ratings = cache.get_tag(seed)[1:]
+                        if not ratings:
+                            ratings = {
+                                team: (0.0, 1.0) for game in games for team in game
+                            }
+                        ratings = ratings | {
+                            team: seed_ratings[team]
+                            for team in teams or ratings
+                            if team in seed_ratings
+                        }
+                    elif ratings:
+                        parity = calc_parity(games, ratings)
+                cached = variadic_call(iter_ratings)(
                     games,
                     convergence=convergence,
                     parity=parity,
                     ratings=ratings,
                     teams=teams,
+                    engine=engine,
+                    workers=workers,
+                    solver=solver,
                 )
-                try:
-                    cache_file.seek(0)
-                    json.dump(cache, cache_file)
-                except Exception as e:
-                    print()
-                    print(cache)
-                    print("CACHE WARNING")
-                    print(e)
-                    print()
-                    breakpoint()
-        return cache[cache_key]
+                cache.put(key, cached, warm_start=seed)
+            cache.tag(cache_key, key, file_digest(games_file), solver_version(engine))
+        return cached
 
     return final_function
 
 
-def fbs_with_fcs(year_selected: int, week_selected: int, convergence: float = 1e-3):
-    file = f"{year_selected}.csv"
+VARIANTS = ("fbsq", "fcsq", "fbs")
+VARIANT_DEPENDENCIES = {"fbsq": (), "fcsq": (), "fbs": ("fbsq", "fcsq")}
+# The division each variant keeps, and whether other divisions are squashed
+VARIANT_DIVISIONS = {
+    "fbsq": ("fbs", True),
+    "fcsq": ("fcs", True),
+    "fbs": ("fbs", False),
+}
+FCS_SQUASHED = "FCS                                     0         "
+FBS_SQUASHED = "FBS                                     0         "
 
-    @cache_ratings
-    @csv2list
-    @add_week_filter(week_selected, file)
-    @add_division_filter("fbs")
-    def fbs_squashed(*args):
-        return args
 
-    @cache_ratings
-    @csv2list
-    @add_week_filter(week_selected, file)
-    @add_division_filter("fcs")
-    def fcs_squashed(*args):
-        return args
+def variant_games(
+    variant: str, week_selected: int, source: str | SeasonTable
+) -> Callable[..., list[tuple[str, str]]]:
+    if variant not in VARIANT_DIVISIONS:
+        raise ValueError(f"Unknown variant {variant!r}")
+    division, squash_others = VARIANT_DIVISIONS[variant]
 
-    @cache_ratings
     @csv2list
-    @add_week_filter(week_selected, file)
-    @add_division_filter("fbs", squash_others=False)
-    def fbs_full(*args):
+    @add_week_filter(week_selected, source)
+    @add_division_filter(division, squash_others=squash_others)
+    @columnar()
+    def games(*args):
         return args
 
+    return games
+
+
+def fbs_seed(
+    squashed: dict[str, tuple[float, float]],
+    fcs_squashed: dict[str, tuple[float, float]],
+) -> tuple[dict[str, tuple[float, float]], list[str]]:
+    # The full FBS run starts its teams at the prior and holds the FCS teams
+    # where the squashed runs place them on the FBS scale
+    teams = [team for team in squashed if team != FCS_SQUASHED]
+    fcs_in_fbs = {}
+    # Until an FBS team plays an FCS team there is nothing to place the FCS on
+    if FCS_SQUASHED in squashed:
+        mu, sigma = squashed[FCS_SQUASHED]
+        fcs_in_fbs = {
+            k: (v[0] * sigma + mu, v[1] * sigma + sigma)
+            for k, v in fcs_squashed.items()
+            if k != FBS_SQUASHED
+        }
+    return {team: (0.0, 1.0) for team in teams} | fcs_in_fbs, teams
+
+
+def solve_variant(
+    year_selected: int,
+    week_selected: int,
+    variant: str,
+    convergence: float = 1e-3,
+    workers: int | None = None,
+    incremental: bool = False,
+    solver: str | None = None,
+):
+    file = f"{year_selected}.csv"
     tag = f"{year_selected}w{week_selected:02}"
-    squashed = fbs_squashed(file, tag + "fbsq", convergence=convergence)[2]
-    mu, sigma = squashed.pop("FCS                                     0         ")
-    fcs_in_fbs = {
-        k: (v[0] * sigma + mu, v[1] * sigma + sigma)
-        for k, v in fcs_squashed(file, tag + "fcsq", convergence=convergence)[2].items()
-    }
-    del fcs_in_fbs["FBS                                     0         "]
-    return fbs_full(
+    warm_start = (
+        [f"{year_selected}w{w:02}{variant}" for w in range(week_selected - 1, -1, -1)]
+        if incremental
+        else None
+    )
+    games = cache_ratings(variant_games(variant, week_selected, file))
+    if variant != "fbs":
+        return games(
+            file,
+            tag + variant,
+            convergence=convergence,
+            workers=workers,
+            warm_start=warm_start,
+            solver=solver,
+        )
+    squashed = solve_variant(
+        year_selected, week_selected, "fbsq", convergence, workers, incremental, solver
+    )[2]
+    fcs_squashed = (
+        solve_variant(
+            year_selected,
+            week_selected,
+            "fcsq",
+            convergence,
+            workers,
+            incremental,
+            solver,
+        )[2]
+        if FCS_SQUASHED in squashed
+        else {}
+    )
+    ratings, teams = fbs_seed(squashed, fcs_squashed)
+    return games(
         file,
-        tag + "fbs",
+        tag + variant,
         convergence=convergence,
-        ratings={team: (0.0, 1.0) for team in squashed} | fcs_in_fbs,
-        teams=list(squashed),
+        ratings=ratings,
+        teams=teams,
+        workers=workers,
+        warm_start=warm_start,
+        solver=solver,
+    )
+
+
+def fbs_with_fcs(
+    year_selected: int,
+    week_selected: int,
+    convergence: float = 1e-3,
+    workers: int | None = None,
+    incremental: bool = False,
+    solver: str | None = None,
+):
+    return solve_variant(
+        year_selected, week_selected, "fbs", convergence, workers, incremental, solver
+    )
+
+
+def solve_league(
+    games_file: str,
+    schema: Schema = COLLEGE_FOOTBALL_DATA,
+    convergence: float = 1e-3,
+):
+    # Every completed game in the file rates one pool of teams, whatever the
+    # sport; the grid engine keeps memory linear in games for large leagues
+    games = cache_ratings(lambda file: all_games(file, indexed=True, schema=schema))
+    return games(
+        games_file,
+        os.path.splitext(os.path.basename(games_file))[0] + "league",
+        convergence=convergence,
+        engine="grid",
     )
 
 
@@ -119,17 +255,54 @@ def print_ratings(ratings: dict[str, tuple[float, float]]):
         print(f"{k}: {v[0]:.{CONVERGENCE_DIGITS}f},  σ = {v[1]:.2f}")
 
 
-def get_fbs_ratings(year: int, week: int) -> dict[str, tuple[float, float]]:
-    with open("RatingsCache.json", "r") as cache_file:
-        cache = json.load(cache_file)
-        if (cache_key := f"{year}w{week:02}fbs") in cache:
-            out = cache[cache_key][2]
-        else:
-            out = fbs_with_fcs(year, week, _CONVERGENCE)[2]
+def get_fbs_ratings(
+    year: int, week: int, solve: bool = True
+) -> dict[str, tuple[float, float]] | None:
+    # None when the week is not cached and solve is False
+    games_file = f"{year}.csv"
+    with RatingsStore() as cache:
+        ratings = cache.ratings(
+            f"{year}w{week:02}fbs",
+            file_digest(games_file) if os.path.exists(games_file) else None,
+            solver_version(),
+            _CONVERGENCE,
+        )
+    if ratings is not None or not solve:
+        return ratings
+    out = fbs_with_fcs(year, week, _CONVERGENCE)[2]
     return {k[:TEAM_NAME_LENGTH].strip(): v for k, v in out.items()}
 
 
+def get_fcs_ratings(
+    year: int, week: int, solve: bool = True
+) -> dict[str, tuple[float, float]] | None:
+    # FCS teams from the squashed FCS run, without the squashed divisions
+    games_file = f"{year}.csv"
+    with RatingsStore() as cache:
+        entry = cache.get_tag(
+            f"{year}w{week:02}fcsq",
+            file_digest(games_file) if os.path.exists(games_file) else None,
+            solver_version(),
+            _CONVERGENCE,
+        )
+    if entry is None:
+        if not solve:
+            return None
+        entry = solve_variant(year, week, "fcsq", _CONVERGENCE)
+    return {
+        k[:TEAM_NAME_LENGTH].strip(): v
+        for k, v in entry[2].items()
+        if k[TEAM_NAME_LENGTH:] != FCS_SQUASHED[TEAM_NAME_LENGTH:]
+    }
+
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) > 1:
+        from cli import main
+
+        sys.exit(main(sys.argv[1:], "fbs"))
+    instrument.sink = instrument.logging_sink()
     year = int_input("Year: ", 2024)
     week = int_input("Week: ", 21)
     print_ratings(get_fbs_ratings(year, week))
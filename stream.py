@@ -0,0 +1,167 @@
+import asyncio
+import os
+from collections import Counter
+from collections.abc import AsyncIterator, Callable, Iterable
+
+import instrument
+from brr_math import iter_ratings
+from cache import Entry
+from data import SeasonTable, read_rows, table_from_rows
+from ratings import FCS_SQUASHED, fbs_seed, variant_games
+
+type Record = list[str]  # one row in the season file's column order
+
+COMPLETED_COLUMN = 3
+
+
+def game_id(record: Record) -> tuple[str, str, str]:
+    # Start time, home id and away id
+    return record[2], record[4], record[9]
+
+
+class LiveWeek:
+    # A season file held in memory while a week is being played: result records
+    # are merged into it and each solve works outward from the changed games,
+    # starting at the previous fixed point
+    def __init__(
+        self,
+        csvfile: str,
+        week: int,
+        convergence: float = 1e-3,
+        engine: str = "quad",
+    ):
+        self.week = week
+        self.convergence = convergence
+        self.engine = engine
+        self.rows = read_rows(csvfile)
+        self.positions = {game_id(row): i for i, row in enumerate(self.rows)}
+        self.games: dict[str, list[tuple[str, str]]] = {}
+        self.seeds: dict[str, dict[str, tuple[float, float]]] = {}
+        self.results: dict[str, Entry] = {}
+
+    def add(self, records: Iterable[Record]) -> int:
+        # Known games are replaced, new ones appended; returns how many
+        # completed games are new or changed
+        changed = 0
+        for record in records:
+            record = list(record)
+            i = self.positions.get(game_id(record))
+            if i is None:
+                i = self.positions[game_id(record)] = len(self.rows)
+                self.rows.append([])
+            changed += (
+                record[COMPLETED_COLUMN].lower() == "true" and self.rows[i] != record
+            )
+            self.rows[i] = record
+        return changed
+
+    def _solve(
+        self,
+        variant: str,
+        table: SeasonTable,
+        ratings: dict[str, tuple[float, float]] | None = None,
+        teams: list[str] | None = None,
+    ) -> Entry:
+        games = variant_games(variant, self.week, table)(table)
+        seed = ratings or {}
+        previous = self.results.get(variant)
+        if (
+            previous is not None
+            and Counter(games) == Counter(self.games[variant])
+            and seed == self.seeds[variant]
+        ):
+            return previous
+        start = {team: (0.0, 1.0) for game in games for team in game} | seed
+        if previous is None:
+            result = iter_ratings(
+                games, self.convergence, 1.0, start, teams, self.engine
+            )
+        else:
+            _, parity, last = previous
+            start |= {team: last[team] for team in teams or start if team in last}
+            if self.engine != "quad":
+                # The grid engine updates every team in one vectorised sweep,
+                # faster than the worklist's one team at a time, so it simply
+                # restarts from the previous fixed point
+                result = iter_ratings(
+                    games, self.convergence, parity, start, teams, self.engine
+                )
+            else:
+                # Only the teams in added or removed games, and the opponents
+                # of teams whose seeds moved, are recomputed at first
+                old_games = Counter(self.games[variant])
+                changed = (Counter(games) - old_games) + (old_games - Counter(games))
+                dirty = {team for game in changed for team in game} | {
+                    team
+                    for team, rating in seed.items()
+                    if self.seeds[variant].get(team) != rating
+                }
+                result = iter_ratings(
+                    games,
+                    self.convergence,
+                    parity,
+                    start,
+                    teams,
+                    self.engine,
+                    solver="worklist",
+                    dirty=[team for team in start if team in dirty],
+                )
+        self.games[variant] = games
+        self.seeds[variant] = seed
+        self.results[variant] = result
+        return result
+
+    def solve(self) -> Entry:
+        table = table_from_rows(self.rows)
+        squashed = self._solve("fbsq", table)[2]
+        fcs_squashed = self._solve("fcsq", table)[2] if FCS_SQUASHED in squashed else {}
+        ratings, teams = fbs_seed(squashed, fcs_squashed)
+        return self._solve("fbs", table, ratings, teams)
+
+
+async def tail(
+    csvfile: str, interval: float = 30.0, rows: list[Record] | None = None
+) -> AsyncIterator[list[Record]]:
+    # Polls the season file and yields the rows that changed since the last
+    # poll, or since rows if given
+    known = {game_id(row): row for row in rows or read_rows(csvfile)}
+    mtime = os.stat(csvfile).st_mtime_ns
+    while True:
+        await asyncio.sleep(interval)
+        if os.stat(csvfile).st_mtime_ns == mtime:
+            continue
+        mtime = os.stat(csvfile).st_mtime_ns
+        current = await asyncio.to_thread(read_rows, csvfile)
+        changed = [row for row in current if known.get(game_id(row)) != row]
+        known = {game_id(row): row for row in current}
+        if changed:
+            yield changed
+
+
+async def drain(queue: asyncio.Queue) -> AsyncIterator[list[Record]]:
+    # Yields every record waiting on the queue as one batch; None ends the
+    # stream after the records before it
+    while True:
+        batch = [await queue.get()]
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if None in batch:
+            if records := batch[: batch.index(None)]:
+                yield records
+            return
+        yield batch
+
+
+async def stream(
+    live: LiveWeek,
+    batches: AsyncIterator[list[Record]],
+    publish: Callable[[Entry], None],
+) -> None:
+    # Solving runs in a thread so the event loop keeps collecting results
+    publish(await asyncio.to_thread(live.solve))
+    async for batch in batches:
+        if not live.add(batch):
+            continue
+        with instrument.phase("live_batch", records=len(batch)):
+            result = await asyncio.to_thread(live.solve)
+        publish(result)